@@ -0,0 +1,480 @@
+import datetime
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import extsort
+import link_parts
+import url_canon
+
+# Wayback Machine CDX server, queried directly instead of rendering its text output in Firefox
+CDX_ENDPOINT = 'http://web.archive.org/cdx/search/cdx'
+
+# Only the two columns the link parts keep (date_time, url)
+CDX_FIELDS = ['timestamp', 'original']
+
+PAGE_LIMIT = 50000  # Captures per request when following resume keys
+
+LINKS_FOLDER = 'yahoo_links_1'
+NEWS_URL = 'https://www.finance.yahoo.com/news/'
+NEW_LINKS_FILE = 'yahoo_links_new.csv'  # Input of experiental/server1.py, new URLs are appended to it
+
+_local = threading.local()
+
+
+def create_session():
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=5,
+        backoff_factor=2,
+        status_forcelist=[429, 500, 502, 503, 504],
+    )
+    adapter = HTTPAdapter(max_retries=retry_strategy)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    # One session per thread, requests.Session is not meant to be shared
+    if not hasattr(_local, 'session'):
+        _local.session = create_session()
+    return _local.session
+
+
+def cdx_query(session, params):
+    response = session.get(CDX_ENDPOINT, params=params, timeout=(15, 300))
+    response.raise_for_status()
+    if not response.text.strip():
+        return []
+    return response.json()
+
+
+def parse_cdx_json(data):
+    # output=json is a list of rows, the first one holding the field names. With
+    # showResumeKey the last two rows are an empty list and [resume_key].
+    if not data:
+        return [], None
+    rows = data[1:]
+    resume_key = None
+    if len(rows) >= 2 and rows[-2] == []:
+        resume_key = rows[-1][0]
+        rows = rows[:-2]
+    return rows, resume_key
+
+
+def iter_cdx_pages(session, url_pattern, fields=CDX_FIELDS, resume_key=None, limit=PAGE_LIMIT, **extra_params):
+    """Yields (rows, resume_key) per request until the CDX server has no resume key left."""
+    while True:
+        params = {
+            'url': url_pattern,
+            'output': 'json',
+            'fl': ','.join(fields),
+            'limit': limit,
+            'showResumeKey': 'true',
+            **extra_params,
+        }
+        if resume_key:
+            params['resumeKey'] = resume_key
+        rows, resume_key = parse_cdx_json(cdx_query(session, params))
+        yield rows, resume_key
+        if not resume_key:
+            break
+
+
+def cdx_num_pages(session, url_pattern, **extra_params):
+    params = {'url': url_pattern, 'showNumPages': 'true', **extra_params}
+    response = session.get(CDX_ENDPOINT, params=params, timeout=(15, 60))
+    response.raise_for_status()
+    return int(response.text.strip() or 0)
+
+
+def iter_cdx_numbered_pages(session, url_pattern, fields=CDX_FIELDS, page=0, **extra_params):
+    """Yields (rows, next_page) for the paged index; an alternative to resume keys."""
+    num_pages = cdx_num_pages(session, url_pattern, **extra_params)
+    while page < num_pages:
+        params = {
+            'url': url_pattern,
+            'output': 'json',
+            'fl': ','.join(fields),
+            'page': page,
+            **extra_params,
+        }
+        rows, _ = parse_cdx_json(cdx_query(session, params))
+        page += 1
+        yield rows, page
+
+
+def clean_links(df):
+    # Canonical article URLs only (see url_canon.SITE_RULES: truncated after
+    # '.html', https, no port, no broken 'news/%' links), one row per URL
+    return url_canon.canonicalize_frame(df, 'url')
+
+
+def prefix_filename(prefix):
+    # Prefixes can hold any urlkey character ('/', '?', '%'), escaped in file names
+    return urllib.parse.quote(prefix, safe='-_.$')
+
+
+def checkpoint_path(prefix, folder=LINKS_FOLDER):
+    return os.path.join(folder, f'yahoo_{prefix_filename(prefix)}.checkpoint.json')
+
+
+def load_checkpoint(prefix, folder=LINKS_FOLDER):
+    path = checkpoint_path(prefix, folder)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {'resume_key': None, 'page': 0, 'rows': 0, 'done': False, 'started': None}
+
+
+def save_checkpoint(prefix, checkpoint, folder=LINKS_FOLDER):
+    # Write then rename, a crash never leaves a half written checkpoint behind
+    path = checkpoint_path(prefix, folder)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+
+def append_links(df, output_filename):
+    write_header = not os.path.exists(output_filename)
+    df.to_csv(output_filename, mode='a', index=False, header=write_header)
+
+
+def fetch_prefix_links(prefix, session=None, folder=LINKS_FOLDER, paged=False, watermarks=None, since=None):
+    """Streams every capture under news/{prefix}* (or of a leaf's exact URL) into yahoo_{prefix}.csv.
+
+    The resume key (or next page number) is checkpointed after every page, so an
+    interrupted prefix continues where it stopped instead of starting over.
+    With since, only captures from that timestamp on are fetched.
+    """
+    session = session or get_session()
+    checkpoint = load_checkpoint(prefix, folder)
+    if checkpoint['done']:
+        return checkpoint['rows']
+    if not checkpoint.get('started'):
+        checkpoint['started'] = utc_timestamp()
+
+    url_pattern = prefix_pattern(prefix)
+    output_filename = os.path.join(folder, f'yahoo_{prefix_filename(prefix)}.csv')
+    extra_params = {'from': since} if since else {}
+    if paged:
+        pages = iter_cdx_numbered_pages(session, url_pattern, page=checkpoint['page'], **extra_params)
+    else:
+        pages = iter_cdx_pages(session, url_pattern, resume_key=checkpoint['resume_key'], **extra_params)
+
+    for rows, position in pages:
+        if rows:
+            df = clean_links(pd.DataFrame(rows, columns=['date_time', 'url']))
+            append_links(df, output_filename)
+            checkpoint['rows'] += len(df)
+        if paged:
+            checkpoint['page'] = position
+        else:
+            checkpoint['resume_key'] = position
+        save_checkpoint(prefix, checkpoint, folder)
+
+    checkpoint['done'] = True
+    save_checkpoint(prefix, checkpoint, folder)
+    if watermarks is not None:
+        watermarks.record(prefix, checkpoint['started'])
+    print(f"{prefix}: {checkpoint['rows']} links")
+    return checkpoint['rows']
+
+
+# Adaptive prefix splitting: instead of the fixed 39x39 two character prefixes,
+# start from the whole news/ folder and only split prefixes that are too big.
+
+PREFIX_CHARS = sorted('abcdefghijklmnopqrstuvwxyz1234567890-_$')  # urlkey (byte) order
+LEAF_MARK = '#'          # Ends a frontier entry standing for the exact URL news/{prefix}; never in a urlkey
+RESULT_CAP = 100000      # Captures fetched per prefix before it counts as truncated
+SPLIT_PAGES = 5          # Prefixes spanning more index pages are split without fetching
+MAX_PREFIX_LENGTH = 12   # Past this, a prefix is paged through with resume keys instead
+NEWS_URLKEY = 'com,yahoo,finance)/news/'  # SURT form of NEWS_URL, the sort key of the CDX index
+FRONTIER_FILE = 'frontier.json'
+
+
+class PrefixFrontier:
+    """Resumable work queue of prefixes still to be queried, kept in frontier.json."""
+
+    def __init__(self, folder=LINKS_FOLDER, roots=('',)):
+        self.path = os.path.join(folder, FRONTIER_FILE)
+        self.lock = threading.Lock()
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            self.pending = state['pending']
+            self.done = set(state['done'])
+        else:
+            self.pending = list(roots)
+            self.done = set()
+            self.save()
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'pending': self.pending, 'done': sorted(self.done)}, f)
+        os.replace(self.path + '.tmp', self.path)
+
+    def take_all(self):
+        with self.lock:
+            return list(self.pending)
+
+    def complete(self, prefix, children):
+        # Children are queued in the same write that retires their parent
+        with self.lock:
+            self.pending.remove(prefix)
+            self.done.add(prefix)
+            children = [c for c in children if c not in self.done and c not in self.pending]
+            self.pending.extend(children)
+            self.save()
+            return children
+
+
+# Incremental refresh: every prefix remembers the time up to which all of its
+# captures have been fetched, later runs only ask for captures after it (from=).
+
+WATERMARK_FILE = 'watermarks.json'
+WATERMARK_OVERLAP_DAYS = 3  # Captures show up in the CDX index with some delay, query a bit before the watermark
+REFRESH_FOLDER = 'refresh'  # Parts, checkpoints and frontier of a refresh run in progress
+DELTA_FOLDER = 'deltas'
+
+
+def utc_timestamp():
+    # CDX timestamps are 14 digit UTC times
+    return time.strftime('%Y%m%d%H%M%S', time.gmtime())
+
+
+class Watermarks:
+    """Per prefix CDX timestamp up to which every capture is known, kept in watermarks.json.
+
+    A prefix without a watermark of its own is covered by its nearest ancestor's.
+    An empty watermark means nothing has been fetched for the prefix yet.
+    """
+
+    def __init__(self, folder=LINKS_FOLDER):
+        self.path = os.path.join(folder, WATERMARK_FILE)
+        self.lock = threading.Lock()
+        self.marks = {}
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.marks = json.load(f)
+
+    def save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.marks, f, indent=0, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
+
+    def get(self, prefix):
+        for end in range(len(prefix), -1, -1):
+            if prefix[:end] in self.marks:
+                return self.marks[prefix[:end]]
+        return None
+
+    def since(self, prefix):
+        mark = self.get(prefix)
+        if not mark:
+            return None
+        start = datetime.datetime.strptime(mark, '%Y%m%d%H%M%S') - datetime.timedelta(days=WATERMARK_OVERLAP_DAYS)
+        return start.strftime('%Y%m%d%H%M%S')
+
+    def record(self, prefix, timestamp, children=()):
+        """Marks prefix as fetched up to timestamp, except for the children still queued.
+
+        The queued children keep the older watermark they had before, so
+        they still ask for everything the parent's capped page did not hold.
+        """
+        with self.lock:
+            covered = self.get(prefix) or ''
+            inherited = {c: max(self.get(c) or '', covered) for c in children}
+            # Watermarks below prefix are superseded, except those of queued children
+            for p in list(self.marks):
+                if p.startswith(prefix) and not any(p.startswith(c) for c in children):
+                    del self.marks[p]
+            self.marks.update(inherited)
+            self.marks[prefix] = timestamp
+            self.save()
+
+
+def is_leaf(prefix):
+    return prefix.endswith(LEAF_MARK)
+
+
+def prefix_pattern(prefix):
+    # A leaf is the one URL its prefix spells out, every other prefix a wildcard query
+    if is_leaf(prefix):
+        return NEWS_URL + prefix[:-len(LEAF_MARK)]
+    return f'{NEWS_URL}{prefix}*'
+
+
+def urlkey_suffix(urlkey):
+    # 'com,yahoo,finance)/news/abc-123.html' -> 'abc-123.html'
+    return urlkey.split('/news/', 1)[-1]
+
+
+def existing_children(session, prefix, since=None):
+    # Collapsing on the urlkey up to one character past the prefix returns a
+    # single row per child that has captures at all, so empty children never
+    # cost a query of their own. '' stands for the URL ending at the prefix.
+    params = {
+        'url': f'{NEWS_URL}{prefix}*',
+        'output': 'json',
+        'fl': 'urlkey',
+        'collapse': f'urlkey:{len(NEWS_URLKEY) + len(prefix) + 1}',
+    }
+    if since:
+        params['from'] = since
+    rows, _ = parse_cdx_json(cdx_query(session, params))
+    return {urlkey_suffix(row[0])[len(prefix):len(prefix) + 1] for row in rows}
+
+
+def split_prefix(prefix, last_urlkey=None, session=None, since=None):
+    """Child prefixes still to query once prefix turned out to be truncated.
+
+    The children are the characters the CDX index actually has after prefix,
+    plus a leaf for a URL ending exactly at it. Results come back in urlkey
+    order, so a capped page already holds every capture of the children
+    sorting before the one it stopped in. Those sparse children are covered by
+    the parent's page and are not queried again. The child holding the last
+    row is queried again from its start. If the children cannot be listed the
+    error is raised, and the prefix stays in the frontier to be retried.
+    """
+    session = session or get_session()
+    children = sorted(existing_children(session, prefix, since))  # urlkey order, the leaf ('') first
+    if last_urlkey is not None:
+        suffix = urlkey_suffix(last_urlkey)
+        if len(suffix) > len(prefix):
+            boundary = suffix[len(prefix)]
+            children = [c for c in children if c >= boundary]
+    return [prefix + (c or LEAF_MARK) for c in children]
+
+
+def fetch_adaptive_prefix(prefix, session=None, folder=LINKS_FOLDER, watermarks=None, incremental=False):
+    """Queries one prefix of the frontier and returns the children it has to be split into.
+
+    With incremental, only captures after the prefix's watermark are asked for.
+    """
+    session = session or get_session()
+    url_pattern = prefix_pattern(prefix)
+    output_filename = os.path.join(folder, f'yahoo_{prefix_filename(prefix)}.csv')
+    since = watermarks.since(prefix) if incremental and watermarks is not None else None
+    started = utc_timestamp()
+
+    if is_leaf(prefix) or len(prefix) >= MAX_PREFIX_LENGTH:
+        # A single URL, or too deep to keep splitting: page through it completely instead
+        fetch_prefix_links(prefix, session, folder, watermarks=watermarks, since=since)
+        return []
+
+    # The page count is cheap to ask for and tells a huge prefix apart before
+    # we download a capped page of it. It ignores from=, so not when refreshing.
+    if since is None and cdx_num_pages(session, url_pattern) > SPLIT_PAGES:
+        print(f"{prefix or '*'}: too many index pages, splitting")
+        children = split_prefix(prefix, session=session)
+        if watermarks is not None:
+            watermarks.record(prefix, started, children)
+        return children
+
+    params = {
+        'url': url_pattern,
+        'output': 'json',
+        'fl': 'urlkey,timestamp,original',
+        'limit': RESULT_CAP,
+        'showResumeKey': 'true',
+    }
+    if since:
+        params['from'] = since
+    rows, resume_key = parse_cdx_json(cdx_query(session, params))
+    if rows:
+        df = pd.DataFrame(rows, columns=['urlkey', 'date_time', 'url'])
+        append_links(clean_links(df[['date_time', 'url']]), output_filename)
+
+    children = []
+    if resume_key or len(rows) >= RESULT_CAP:
+        children = split_prefix(prefix, rows[-1][0] if rows else None, session, since)
+        print(f"{prefix or '*'}: truncated at {len(rows)} captures, splitting into {len(children)}")
+    else:
+        print(f"{prefix or '*'}: {len(rows)} captures" + (f" since {since}" if since else ""))
+    if watermarks is not None:
+        watermarks.record(prefix, started, children)
+    return children
+
+
+def crawl_frontier(num_threads=4, folder=LINKS_FOLDER, watermarks=None, incremental=False):
+    """Works through the prefix frontier until no prefix is left to query."""
+    frontier = PrefixFrontier(folder)
+    if watermarks is None:
+        watermarks = Watermarks(folder)
+
+    def submit(executor, prefix):
+        return executor.submit(fetch_adaptive_prefix, prefix, None, folder, watermarks, incremental)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        futures = {submit(executor, p): p for p in frontier.take_all()}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                prefix = futures.pop(future)
+                try:
+                    children = frontier.complete(prefix, future.result())
+                except Exception as e:
+                    # Stays pending in frontier.json and is retried on the next run
+                    print(f"Error fetching prefix {prefix}: {e}")
+                    continue
+                for child in children:
+                    futures[submit(executor, child)] = child
+    print(f"Frontier finished, {len(frontier.done)} prefixes queried, {len(frontier.pending)} left after errors")
+    return not frontier.pending
+
+
+def frontier_finished(folder=LINKS_FOLDER):
+    path = os.path.join(folder, FRONTIER_FILE)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r') as f:
+        return not json.load(f)['pending']
+
+
+def refresh_links(num_threads=4, folder=LINKS_FOLDER, output_file='yfin_urls.csv', new_links_file=NEW_LINKS_FILE):
+    """Fetches only the captures newer than each prefix's watermark and emits the new URLs.
+
+    The refresh runs its own frontier, starting again from news/*, in
+    folder/refresh/ and resumes there after an interruption. Once it is done,
+    its captures become one more part, the URLs missing from output_file are
+    written to folder/deltas/ and appended to new_links_file for the server.
+    Returns the number of new URLs.
+    """
+    staging = os.path.join(folder, REFRESH_FOLDER)
+    os.makedirs(staging, exist_ok=True)
+    if not crawl_frontier(num_threads, staging, Watermarks(folder), incremental=True):
+        print("Refresh not finished, run again to retry the failed prefixes")
+        return 0
+
+    new_urls = 0
+    if glob.glob(os.path.join(staging, '*.csv')):
+        stamp = utc_timestamp()
+        # Known URLs, sorted by url, before the refresh part is merged into them
+        link_parts.merge_link_parts(folder, output_file)
+        part = os.path.join(folder, f'yahoo_refresh_{stamp}.csv')
+        link_parts.merge_link_parts(staging, part)
+
+        delta_folder = os.path.join(folder, DELTA_FOLDER)
+        os.makedirs(delta_folder, exist_ok=True)
+        delta_file = os.path.join(delta_folder, f'yahoo_delta_{stamp}.csv')
+        new_urls = extsort.anti_join_sorted(part, output_file, 'url', delta_file)
+        if new_urls:
+            append_links(pd.read_csv(delta_file), new_links_file)
+        print(f"{new_urls} new URLs saved to {delta_file} and appended to {new_links_file}")
+        link_parts.merge_link_parts(folder, output_file)
+    else:
+        print("No new captures since the last run")
+    shutil.rmtree(staging)
+    return new_urls
@@ -0,0 +1,43 @@
+"""build_entities on a small dump gives the expected info entries
+
+python checks/check_dump_builder.py
+
+wikidata_dump_sample.json covers: preferred vs normal vs deprecated ranks, unknown-value
+main snaks and qualifiers, a start without an end, labels missing in English, a ticker
+on a normal-rank exchange statement, and labels that come after the company in the dump.
+"""
+import json
+import os
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+import wikidata_dump_builder
+
+
+def main():
+    with open(os.path.join(HERE, 'wikidata_dump_expected.json'), 'r', encoding='utf-8') as f:
+        expected = json.load(f)
+    with tempfile.TemporaryDirectory() as folder:
+        written = wikidata_dump_builder.build_entities(
+            os.path.join(HERE, 'wikidata_dump_sample.json'), folder, processes=1)
+        files = sorted(name for name in os.listdir(folder) if name.endswith('_info.json'))
+        assert files == sorted(f'{symbol}_info.json' for symbol in expected), files
+        assert written == len(expected), written
+        for symbol, entries in expected.items():
+            with open(os.path.join(folder, f'{symbol}_info.json'), 'r', encoding='utf-8') as f:
+                actual = json.load(f)
+            assert actual == entries, (symbol, actual)
+
+        # Only the given symbols
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+        wikidata_dump_builder.build_entities(
+            os.path.join(HERE, 'wikidata_dump_sample.json'), folder, symbols=['beta'], processes=1)
+        assert sorted(os.listdir(folder)) == ['BETA_info.json'], os.listdir(folder)
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""读取超时时批次会被拆小: 本地端点对超过 MAX_FAST 个代码的查询不及时回应
+
+python checks/check_query_timeout.py
+"""
+import http.server
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ticker_symbol_query_rate_limit_protected as q
+
+MAX_FAST = 2
+STALL = 1.0
+sizes = []
+
+
+class SlowEndpoint(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)['query'][0]
+        match = re.search(r'VALUES \?symbol \{([^}]*)\}', query)
+        size = len(match.group(1).split()) if match else 1
+        sizes.append(size)
+        if size > MAX_FAST:
+            threading.Event().wait(STALL)
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"results": {"bindings": []}}')
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    q.ENDPOINT_URL = f'http://127.0.0.1:{server.server_address[1]}/sparql'
+    q.QUERY_TIMEOUT = (5, STALL / 4)
+    q.use_response_cache = False
+    symbols = [f'S{i}' for i in range(8)]
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        q.INFO_FOLDER = os.path.join(folder, 'info')
+        real_sleep = time.sleep
+        time.sleep = lambda seconds: None  # 跳过成功后的等待和限速间隔
+        try:
+            for name, run in [
+                ('query_batches', lambda: q.query_batches(
+                    symbols, q.create_session(status_forcelist=(502,), read_retries=False),
+                    {'processed': [], 'failed': []})),
+                ('fetch_concurrently', lambda: q.fetch_concurrently(
+                    symbols, {'processed': [], 'failed': []}, batch_size=8)),
+            ]:
+                sizes.clear()
+                progress = run()
+                assert sorted(progress['processed']) == symbols, progress
+                assert not progress['failed'], progress
+                assert max(sizes) == 8 and MAX_FAST in sizes, sizes
+                # 每个超时的批次只请求一次，没有在会话里重试
+                assert sizes.count(8) <= 3, sizes
+                print(f"{name}: 批次大小 {sorted(set(sizes), reverse=True)}")
+        finally:
+            time.sleep = real_sleep
+    server.shutdown()
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,8 @@ from bs4 import BeautifulSoup
 from selenium.webdriver.support.ui import WebDriverWait
 from importlib import import_module
 
+import url_canon
+
 # Desired request rate (requests per second)
 DESIRED_REQUEST_RATE = 5.8  # Adjust this value as needed
 
@@ -348,12 +350,12 @@ def main():
     already_scraped_fails = scraped_fails      # ADDED
     already_scraped_total = already_scraped_success + already_scraped_fails  # ADDED
 
-    # Filter out already scraped URLs
-    df_links = df_links[
-        ~df_links["url"].astype(str).isin(scraped_urls)
-    ]
+    # Filter out already scraped URLs, compared by canonical form so variants
+    # of a scraped URL (http/https, :80, query strings) are not fetched again
+    df_links = url_canon.canonicalize_frame(df_links, "url")
+    df_links = df_links[url_canon.unseen_mask(df_links["url"], list(scraped_urls))]
     # Convert 'url' column to list
-    urls = df_links["url"].astype(str).tolist()
+    urls = df_links["url"].tolist()
     total_urls = len(urls)
     print(f"Total URLs in CSV: {initial_total}")  # ADDED
     print(f"Already scraped (Success + Fails): {already_scraped_total}")  # ADDED
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import math
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from dateutil import parser
+from dateutil.tz import tzutc
+
+from name_matcher import FuzzyMatcher, WordMatcher
+
+ATTRIBUTES = ['id_label', 'ticker', 'aliases', 'products', 'subsidiaries', 'owned_entities', 'ceos', 'board_members']
+
+ARRAYS = ['entry_ticker', 'entry_attribute', 'entry_name', 'entry_kind', 'entry_start', 'entry_end']
+
+EXACT, FUZZY = 1, 2
+NO_START = np.iinfo(np.int64).min
+NO_END = np.iinfo(np.int64).max
+
+
+def to_epoch(date):
+    # Naive datetimes are taken as UTC
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=tzutc())
+    return date.timestamp()
+
+
+def parse_epoch(value):
+    """(floor, ceil) epoch seconds of a date string, None if it is missing."""
+    if value is None:
+        return None
+    seconds = to_epoch(parser.parse(str(value)))
+    return math.floor(seconds), math.ceil(seconds)
+
+
+def parse_epochs(values):
+    """(floor, ceil, dated) arrays of a column of date strings, like parse_epoch on each row.
+
+    ISO 8601 strings are parsed in one vectorized call, only the rows that fail
+    go through dateutil. dated is False where the date is missing or unparseable.
+    """
+    values = pd.Series(values, dtype=object).reset_index(drop=True)
+    parsed = pd.to_datetime(values, format='ISO8601', utc=True, errors='coerce')
+    micros = parsed.dt.as_unit('us').astype('int64').to_numpy()
+    floor = micros // 1000000
+    ceil = -(-micros // 1000000)
+    dated = parsed.notna().to_numpy(copy=True)
+    for i in np.flatnonzero(~dated & values.notna().to_numpy()):
+        try:
+            floor[i], ceil[i] = parse_epoch(values[i])
+            dated[i] = True
+        except (ValueError, OverflowError, parser.ParserError):
+            pass
+    return floor, ceil, dated
+
+
+def name_kind(name):
+    # Uppercase names must appear as whole words, the others are matched fuzzily,
+    # and single lowercase words are too ambiguous to match at all
+    if name.isupper():
+        return EXACT if len(name) > 1 else 0
+    if not (name.islower() and name.replace(' ', '').isalpha()):
+        return FUZZY
+    return 0
+
+
+class EntityDictionary:
+    """Every matchable (ticker, attribute, name) of the entity data, in flat arrays.
+
+    Entries keep the order of looping over the processed data, so matches
+    come out in the same order. Validity periods are int64 epoch seconds,
+    inclusive, NO_START / NO_END when open.
+    """
+
+    def __init__(self, tickers, names, entry_ticker, entry_attribute, entry_name, entry_kind, entry_start, entry_end):
+        self.tickers = list(tickers)
+        self.names = list(names)
+        self.entry_ticker = np.asarray(entry_ticker, dtype=np.int32)
+        self.entry_attribute = np.asarray(entry_attribute, dtype=np.int8)
+        self.entry_name = np.asarray(entry_name, dtype=np.int32)
+        self.entry_kind = np.asarray(entry_kind, dtype=np.int8)
+        self.entry_start = np.asarray(entry_start, dtype=np.int64)
+        self.entry_end = np.asarray(entry_end, dtype=np.int64)
+        self.compile_matchers()
+
+    @classmethod
+    def from_processed_data(cls, processed_data):
+        """processed_data: {ticker: {attribute: {name: (start, end)}}} with epoch seconds or None."""
+        names = {}
+        columns = ([], [], [], [], [], [])
+        for ticker_id, (ticker, value) in enumerate(processed_data.items()):
+            for attribute, periods in value.items():
+                for name, (start, end) in periods.items():
+                    kind = name_kind(name)
+                    if not kind:
+                        continue
+                    row = (
+                        ticker_id,
+                        ATTRIBUTES.index(attribute),
+                        names.setdefault(name, len(names)),
+                        kind,
+                        NO_START if start is None else start,
+                        NO_END if end is None else end,
+                    )
+                    for column, item in zip(columns, row):
+                        column.append(item)
+        return cls(list(processed_data), list(names), *columns)
+
+    def save(self, folder):
+        # One .npy per array so load can memory map them
+        os.makedirs(folder, exist_ok=True)
+        for array in ARRAYS:
+            np.save(os.path.join(folder, f'{array}.npy'), getattr(self, array))
+        with open(os.path.join(folder, 'names.json'), 'w', encoding='utf-8') as f:
+            json.dump({'tickers': self.tickers, 'names': self.names}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, folder):
+        with open(os.path.join(folder, 'names.json'), 'r', encoding='utf-8') as f:
+            labels = json.load(f)
+        arrays = [np.load(os.path.join(folder, f'{array}.npy'), mmap_mode='r') for array in ARRAYS]
+        return cls(labels['tickers'], labels['names'], *arrays)
+
+    def compile_matchers(self):
+        entries = np.arange(len(self.entry_name))
+        self.exact_entries = entries[self.entry_kind == EXACT]
+        self.fuzzy_entries = entries[self.entry_kind == FUZZY]
+        # Payloads are entry ids, the matchers report them in entry order
+        self.exact_matcher = WordMatcher([(self.names[self.entry_name[e]], e) for e in self.exact_entries])
+        self.fuzzy_matcher = FuzzyMatcher([(self.names[self.entry_name[e]], e) for e in self.fuzzy_entries], threshold=95)
+
+    def ticker_signatures(self):
+        """{ticker: hash of its entries}, to tell which tickers changed between two dictionaries."""
+        hashes = [hashlib.sha1() for _ in self.tickers]
+        for entry in range(len(self.entry_name)):
+            hashes[self.entry_ticker[entry]].update(json.dumps([
+                ATTRIBUTES[self.entry_attribute[entry]], self.names[self.entry_name[entry]],
+                int(self.entry_kind[entry]), int(self.entry_start[entry]), int(self.entry_end[entry]),
+            ]).encode('utf-8'))
+        return dict((ticker, h.hexdigest()) for ticker, h in zip(self.tickers, hashes))
+
+    def ticker_mask(self, tickers):
+        """Boolean array over the entries of the given tickers."""
+        tickers = set(tickers)
+        ids = [i for i, ticker in enumerate(self.tickers) if ticker in tickers]
+        return np.isin(self.entry_ticker, ids)
+
+    def valid_at(self, article_epoch):
+        """Boolean array over the entries whose period holds the article's (floor, ceil) epoch."""
+        floor, ceil = article_epoch
+        return (self.entry_start <= floor) & (ceil <= self.entry_end)
+
+    def match(self, article_text, title, article_epoch, entry_mask=None):
+        """{ticker: {'text': {name: positions}, 'title': {...}}} for one article.
+
+        Articles without a date match nothing, periods cannot be checked for them.
+        With entry_mask only those entries are matched (see ticker_mask).
+        """
+        if article_epoch is None:
+            return {}
+        valid = self.valid_at(article_epoch)
+        if entry_mask is not None:
+            valid &= entry_mask
+
+        hits = []
+        for field, text in (('text', article_text), ('title', title)):
+            for entry, name, positions in self.exact_matcher.find(text):
+                if valid[entry]:
+                    hits.append((entry, field, name, positions))
+            # fuzz.partial_ratio(text, name) > 95, positions found with the name as a regex
+            for entry, name in self.fuzzy_matcher.find(text, valid[self.fuzzy_entries]):
+                hits.append((entry, field, name, [m.start() for m in re.finditer(name, text)]))
+
+        ticker_matches = {}
+        for entry, field, name, positions in sorted(hits, key=lambda hit: hit[0]):
+            ticker = self.tickers[self.entry_ticker[entry]]
+            matched_names = ticker_matches.setdefault(ticker, {'text': {}, 'title': {}})
+            matched_names[field].setdefault(name, positions)
+        return ticker_matches
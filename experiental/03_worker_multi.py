@@ -1,4 +1,3 @@
-import json
 import undetected_chromedriver as uc
 from urllib3.exceptions import ProtocolError
 from selenium.common.exceptions import WebDriverException
@@ -11,10 +10,11 @@ from bs4 import BeautifulSoup
 import multiprocessing
 import queue
 import time
-import os
 import random
 import logging
 
+import template_engine
+
 # Set up logging
 logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -35,12 +35,15 @@ NUM_BROWSERS = 5
 def load_templates():
     global templates
     try:
-        with open('templates.json', 'r') as file:
-            templates = json.load(file)
+        # Every template is validated and compiled on load
+        templates = template_engine.load_templates('templates.json')
         logging.debug(f"Templates loaded: {templates}")
     except FileNotFoundError:
         logging.warning("templates.json not found. Using empty templates.")
         templates = {}
+    except template_engine.TemplateError as e:
+        logging.error(f"Invalid template in templates.json: {e}")
+        templates = {}
 
 def initialize_browser(worker_id, port):
     options = uc.ChromeOptions()
@@ -100,54 +103,10 @@ def extract_article_data(driver, url, template_name):
 
         template = templates.get(template_name)
         if template:
-            article_data = {}
             page_source = driver.page_source
             soup = BeautifulSoup(page_source, 'html.parser')
-
-            def extract_elements(selector_info, parent_element):
-                selector = selector_info['selector']
-                attribute = selector_info['attribute']
-                index = selector_info.get('index')
-                inner = selector_info.get('inner', [])
-
-                elements = parent_element.select(selector)
-                if elements:
-                    if index:
-                        # If index is provided, use it
-                        elements = [elements[i] for i in index if i < len(elements)]
-                    # If no index is provided, or if it's an empty list, use all elements
-                    value = []
-                    for element in elements:              
-                        if inner:
-                            inner_value = []
-                            inner_value.extend(extract_elements(inner, element))
-                            value.append(inner_value)
-                        else:
-                            if attribute == 'text':
-                                value.append(element.get_text(strip=True))
-                            else:
-                                value.append(element.get(attribute))
-                    return value
-                else:
-                    logging.debug(f"No elements found for selector: {selector}")
-                    return []
-                
-            for field, selector_info in template.items():
-                try:
-                    if isinstance(selector_info, dict):
-                        value = extract_elements(selector_info, soup)
-                        article_data[field] = value
-                    else:
-                        element = soup.select_one(selector_info)
-                        if element:
-                            article_data[field] = element.get_text(strip=True)
-                        else:
-                            article_data[field] = ''
-
-                    logging.debug(f"Extracted {field}: {article_data[field][:50]}...")
-                except Exception as e:
-                    logging.error(f"Error extracting {field}: {e}")
-                    article_data[field] = ''
+            # The template is compiled once per process and reused for every page
+            article_data = template_engine.get_plan(template_name, template).extract(soup)
 
             article_data['html_source'] = page_source
             logging.debug(f"Extraction completed for URL: {url}")
@@ -6,6 +6,7 @@ import sys
 import time
 import socket
 import json
+import uuid
 from selenium import webdriver
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
@@ -14,8 +15,11 @@ from selenium.webdriver.support.ui import WebDriverWait
 HOST = 'localhost'  # Server IP address
 PORT = 8000         # Server port
 
-# Desired request rate (requests per second)
-DESIRED_REQUEST_RATE = 8  # Adjust this value as needed
+# The request rate is set by the server for the whole cluster: every URL in a
+# task batch carries a token, and the server says when to ask again
+
+# Address this client fetches from, if it differs from the one the server sees (proxy, NAT)
+EGRESS_IP = None
 
 # Maximum number of scraper threads
 MAX_THREADS = 8  # Define the number of worker threads
@@ -23,6 +27,12 @@ MAX_THREADS = 8  # Define the number of worker threads
 MIN_QUEUE_LENGTH = 10  # Minimum task queue length before requesting more URLs
 BATCH_SIZE = 20        # Number of URLs to request from the server at a time
 
+EMPTY_BATCH_WAIT = 1  # Least seconds to wait before asking again after an empty batch
+
+HEARTBEAT_INTERVAL = 15  # Seconds between lease renewals, well below the server's lease duration
+
+CLIENT_ID = None  # Fixed id for this client; a random one is generated per run when None
+
 # Initialize print queue
 print_queue = queue.Queue()
 
@@ -91,18 +101,65 @@ class Client:
         self.stop_event = threading.Event()
         self.sock = None
         self.sock_lock = threading.Lock()
+        # Set while there is a live connection to the server
+        self.connected = threading.Event()
+        # Lets the server match this client to its leases across reconnects and server restarts
+        self.client_id = CLIENT_ID or uuid.uuid4().hex
+        # URLs leased from the server that have not been reported back yet
+        self.held_urls = set()
+        self.held_lock = threading.Lock()
+        # Number of the last task batch received, echoed in heartbeats
+        self.last_batch = 0
+        # Set when the server answers a task request
+        self.batch_received = threading.Event()
+        self.retry_after = 0
 
     def connect_to_server(self):
         while not self.stop_event.is_set():
             try:
-                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.sock.connect((HOST, PORT))
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.connect((HOST, PORT))
+                hello = {'type': 'hello', 'client_id': self.client_id}
+                if EGRESS_IP:
+                    hello['egress_ip'] = EGRESS_IP
+                sock.sendall((json.dumps(hello) + '\n').encode('utf-8'))
+                with self.sock_lock:
+                    self.sock = sock
+                self.connected.set()
                 print_queue.put("Connected to server.")
                 break
             except Exception as e:
                 print_queue.put(f"Connection failed: {e}, retrying in 5 seconds...")
                 time.sleep(5)
 
+    def disconnect(self, sock):
+        # Only the receiver thread reconnects, everybody else waits for it
+        self.connected.clear()
+        try:
+            # shutdown() wakes up a recv() blocked on this socket in the receiver thread
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+    def send_message(self, message):
+        # Returns False if the message could not be sent; the caller decides whether to retry
+        while not self.connected.wait(timeout=1):
+            if self.stop_event.is_set():
+                return False
+        with self.sock_lock:
+            sock = self.sock
+            try:
+                sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+                return True
+            except OSError as e:
+                print_queue.put(f"Server disconnected while sending {message['type']}: {e}")
+                self.disconnect(sock)
+                return False
+
     def start(self):
         # Start print thread
         print_thread = threading.Thread(target=self.print_thread_func, daemon=True)
@@ -127,6 +184,10 @@ class Client:
         monitor_thread = threading.Thread(target=self.monitor_task_queue, daemon=True)
         monitor_thread.start()
 
+        # Start renewing leases on the URLs we hold
+        heartbeat_thread = threading.Thread(target=self.send_heartbeats, daemon=True)
+        heartbeat_thread.start()
+
         # Keep the main thread alive to handle KeyboardInterrupt
         try:
             while not self.stop_event.is_set():
@@ -139,6 +200,7 @@ class Client:
         receiver_thread.join()
         sender_thread.join()
         monitor_thread.join()
+        heartbeat_thread.join()
         for thread in self.scraper_threads:
             thread.join()
         print_thread.join()
@@ -147,11 +209,22 @@ class Client:
         buffer = ""
         try:
             while not self.stop_event.is_set():
-                data = self.sock.recv(4096)
+                if not self.connected.is_set():
+                    # Reconnect and carry on; the leases we hold are still ours
+                    buffer = ""
+                    self.connect_to_server()
+                    continue
+                sock = self.sock
+                try:
+                    data = sock.recv(4096)
+                except OSError as e:
+                    data = b""
+                    print_queue.put(f"Error receiving tasks: {e}")
                 if not data:
-                    print_queue.put("Server closed the connection.")
-                    self.stop_event.set()
-                    break
+                    print_queue.put("Server closed the connection, reconnecting...")
+                    self.disconnect(sock)
+                    time.sleep(1)
+                    continue
                 buffer += data.decode('utf-8')
                 while '\n' in buffer:
                     message, buffer = buffer.split('\n', 1)
@@ -165,10 +238,19 @@ class Client:
                         continue
                     if msg['type'] == 'task_batch':
                         urls = msg.get('urls', [])
+                        with self.held_lock:
+                            self.held_urls.update(urls)
+                            self.last_batch = msg.get('batch', self.last_batch)
                         for url in urls:
                             self.task_queue.put(url)
+                        self.retry_after = msg.get('retry_after', 0)
+                        if not urls:
+                            # Nothing left for now, don't ask again at round trip speed
+                            self.retry_after = max(self.retry_after, EMPTY_BATCH_WAIT)
+                        self.batch_received.set()
                         print_queue.put(f"Received {len(urls)} new tasks.")
                     elif msg['type'] == 'no_task':
+                        # The crawl is finished: stop, rather than reconnecting when the server hangs up
                         print_queue.put("No more tasks available from server.")
                         self.stop_event.set()
                         break
@@ -178,7 +260,8 @@ class Client:
             print_queue.put(f"Error receiving tasks: {e}")
             self.stop_event.set()
         finally:
-            self.sock.close()
+            if self.sock:
+                self.sock.close()
 
     def send_results(self):
         try:
@@ -187,24 +270,18 @@ class Client:
                     url, result = self.result_queue.get(timeout=1)
                 except queue.Empty:
                     continue
-                try:
-                    message = {'type': 'result', 'url': url, 'html_content': result}
-                    with self.sock_lock:
-                        self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
-                    self.result_queue.task_done()
-                except BrokenPipeError:
-                    print_queue.put("Server disconnected. Cannot send results.")
-                    self.stop_event.set()
-                    break
-                except Exception as e:
-                    print_queue.put(f"Error sending results: {e}")
-                    self.stop_event.set()
-                    break
+                message = {'type': 'result', 'url': url, 'html_content': result}
+                # Keep the result until it goes through, across reconnects
+                while not self.send_message(message):
+                    if self.stop_event.is_set():
+                        break
+                else:
+                    with self.held_lock:
+                        self.held_urls.discard(url)
+                self.result_queue.task_done()
         except Exception as e:
             print_queue.put(f"Error in send_results: {e}")
             self.stop_event.set()
-        finally:
-            self.sock.close()
 
     def monitor_task_queue(self):
         try:
@@ -213,26 +290,37 @@ class Client:
                 print_queue.put(f"Task Queue Length: {queue_length}")
                 if queue_length < MIN_QUEUE_LENGTH:
                     # Request more tasks from server
-                    try:
-                        with self.sock_lock:
-                            request = {'type': 'request_tasks', 'num_urls': BATCH_SIZE}
-                            self.sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
-                            print_queue.put(f"Requested {BATCH_SIZE} more tasks from server.")
-                    except BrokenPipeError:
-                        print_queue.put("Server disconnected. Cannot request more tasks.")
-                        self.stop_event.set()
-                        break
-                    except Exception as e:
-                        print_queue.put(f"Error requesting more tasks: {e}")
-                        self.stop_event.set()
-                        break
-                    time.sleep(1 / DESIRED_REQUEST_RATE)  # To maintain desired request rate
+                    self.batch_received.clear()
+                    request = {'type': 'request_tasks', 'num_urls': BATCH_SIZE}
+                    if EGRESS_IP:
+                        request['egress_ip'] = EGRESS_IP
+                    if not self.send_message(request):
+                        continue
+                    print_queue.put(f"Requested {BATCH_SIZE} more tasks from server.")
+                    # Wait for the batch, then for as long as the server's token budget asks
+                    self.batch_received.wait(timeout=10)
+                    self.stop_event.wait(self.retry_after)
                 else:
                     time.sleep(1)
         except Exception as e:
             print_queue.put(f"Error monitoring task queue: {e}")
             self.stop_event.set()
 
+    def send_heartbeats(self):
+        # Renews the lease on every URL still queued, in progress or waiting to be sent.
+        # A wedged browser keeps its URL listed here, so the server also caps how long
+        # a URL may stay out before another client gets a copy of it.
+        try:
+            while not self.stop_event.wait(HEARTBEAT_INTERVAL):
+                with self.held_lock:
+                    urls = list(self.held_urls)
+                    batch = self.last_batch
+                # The batch number tells the server which of its grants this list already covers
+                self.send_message({'type': 'heartbeat', 'urls': urls, 'batch': batch})
+        except Exception as e:
+            print_queue.put(f"Error in send_heartbeats: {e}")
+            self.stop_event.set()
+
     def print_thread_func(self):
         try:
             while not self.stop_event.is_set() or not print_queue.empty():
@@ -1,5 +1,4 @@
 import csv
-import json
 from selenium import webdriver
 from selenium.webdriver.firefox.service import Service
 from selenium.webdriver.firefox.options import Options
@@ -13,7 +12,8 @@ import queue
 import traceback
 import random
 import re
-import logging
+
+import template_engine
 
 # Number of worker threads
 num_threads = 16
@@ -56,47 +56,8 @@ def extract_ticker_symbols_from_links(soup):
 
 # Function to extract article data
 def extract_article_data(soup, template):
-    article_data = {}
-    
-    def extract_elements(selector_info, parent_element):
-        selector = selector_info['selector']
-        attribute = selector_info.get('attribute', 'text')
-        index = selector_info.get('index')
-        inner = selector_info.get('inner')
-
-        elements = parent_element.select(selector)
-        if elements:
-            if index:
-                elements = [elements[i] for i in index if i < len(elements)]
-            value = []
-            for element in elements:
-                if inner:
-                    inner_value = extract_elements(inner, element)
-                    value.append(inner_value)
-                else:
-                    if attribute == 'text':
-                        value.append(element.get_text(strip=True))
-                    else:
-                        value.append(element.get(attribute, ''))
-            return value
-        else:
-            return []
-    
-    for field, selector_info in template.items():
-        try:
-            if isinstance(selector_info, dict):
-                value = extract_elements(selector_info, soup)
-                article_data[field] = value
-            else:
-                element = soup.select_one(selector_info)
-                if element:
-                    article_data[field] = element.get_text(strip=True)
-                else:
-                    article_data[field] = ''
-        except Exception as e:
-            logging.error(f"Error extracting {field}: {e}")
-            article_data[field] = ''
-    return article_data
+    # A spec without 'attribute' gives the text, a missing attribute gives ''
+    return template_engine.get_plan('local', template, default_attribute='text', missing='').extract(soup)
 
 # Function to scrape article content
 def scrape_article_content(url_queue, result_queue):
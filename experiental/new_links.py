@@ -1,6 +1,8 @@
 import pandas as pd
 import os
 
+import url_canon
+
 def find_new_urls(new_file, old_file, output_file):
     print(f"Comparing URLs in {new_file} and {old_file}...")
     
@@ -19,20 +21,17 @@ def find_new_urls(new_file, old_file, output_file):
         print(f"Old file columns: {old_df.columns.tolist()}")
         return
     
-    # Extract URLs
-    new_urls = set(new_df['url'].tolist())
-    old_urls = set(old_df['url'].tolist())
+    # Canonical URLs, so http/https, :80 or query string variants count as the same URL
+    new_df = url_canon.canonicalize_frame(new_df, 'url')
+    old_urls = url_canon.canonicalize(old_df['url']).dropna().unique()
     
     # Find URLs in new file but not in old file
-    unique_new_urls = new_urls - old_urls
+    result_df = new_df[url_canon.unseen_mask(new_df['url'], old_urls)]
     
     # Statistics
-    print(f"Total URLs in new file: {len(new_urls)}")
+    print(f"Total URLs in new file: {len(new_df)}")
     print(f"Total URLs in old file: {len(old_urls)}")
-    print(f"URLs unique to new file: {len(unique_new_urls)}")
-    
-    # Create DataFrame with new URLs
-    result_df = new_df[new_df['url'].isin(unique_new_urls)]
+    print(f"URLs unique to new file: {len(result_df)}")
     
     # Save to CSV
     result_df.to_csv(output_file, index=False)
@@ -1,23 +1,47 @@
 # server.py
 
+import asyncio
 import threading
-import queue
 import os
 import sys
 import time
 import pandas as pd
 import csv
 import signal
-import socket
+import sqlite3
 import json
 from importlib import import_module
 import logging
 from bs4 import BeautifulSoup
 
+import url_canon
+
 HOST = 'localhost'  # Server IP address
 PORT = 8000         # Server port
 
-MAX_CLIENTS = 5     # Maximum number of clients
+WEBSITE = "yfin"    # Extractor module and prefix of the output / task store files
+
+LISTEN_BACKLOG = 512           # Pending connections the OS may queue for accept()
+MAX_MESSAGE_SIZE = 64 * 2**20  # Largest single JSON line (a result carries a whole HTML page)
+MAX_INFLIGHT_PER_CLIENT = 64   # URLs a single client may hold before it has to return results
+RESULT_QUEUE_SIZE = 256        # Results buffered ahead of the persistence stage
+
+LEASE_DURATION = 120       # Seconds a client may hold a URL without renewing it
+LEASE_CHECK_INTERVAL = 5   # Seconds between sweeps for expired leases
+STRAGGLER_AGE = 300        # Seconds after which a held URL is also handed to an idle client
+MAX_LEASE_COPIES = 2       # Clients that may hold the same URL at once (original + speculative)
+EMPTY_BATCH_RETRY = 5      # Seconds a client waits before asking again after an empty batch
+
+GLOBAL_REQUEST_RATE = 8    # Requests per second the whole cluster may send to the site
+PER_IP_REQUEST_RATE = 5.8  # Requests per second from any single egress IP
+TOKEN_BURST_SECONDS = 2    # Seconds of unused budget a bucket may save up
+RATE_LIMIT_BACKOFF = 0.5   # The global rate is multiplied by this on every rate limit observation
+RATE_LIMIT_COOLDOWN = 30   # Observations within this many seconds of a cut count as the same event
+RATE_LIMIT_WAIT = 200      # Seconds an egress IP gets no tokens after it was rate limited
+RATE_RECOVERY_INTERVAL = 10  # Seconds between additive rate increases after a cut
+RATE_RECOVERY_STEP = 0.05    # Fraction of the configured rate won back per interval
+
+STORE_COMMIT_INTERVAL = 1  # Seconds between commits of the task store
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -51,266 +75,698 @@ class StatsTracker:
             response_rate = len(self._response_times) / 10
             return request_rate, response_rate
 
-def display_stats(stats_tracker, total_urls, stop_event):
-    try:
-        while not stop_event.is_set():
-            request_rate, response_rate = stats_tracker.get_stats()
-            total_processed = stats_tracker.total_responses
-            progress = (total_processed / total_urls) * 100 if total_urls else 0
-            stats_line = (
-                f"Request Rate: {request_rate:.2f}/s | "
-                f"Response Rate: {response_rate:.2f}/s | "
-                f"Progress: {progress:.2f}%"
-            )
-            logger.info(stats_line)
-            time.sleep(1)
-    except KeyboardInterrupt:
-        pass
-
-class ClientHandlerThread(threading.Thread):
-    def __init__(self, conn, addr, server):
-        super().__init__()
-        self.conn = conn
-        self.addr = addr
+async def display_stats(server):
+    while not server.stop_event.is_set():
+        request_rate, response_rate = server.stats_tracker.get_stats()
+        total_processed = len(server.leases.completed)
+        progress = (total_processed / server.total_urls) * 100 if server.total_urls else 0
+        stats_line = (
+            f"Clients: {len(server.clients)} | "
+            f"Rate Budget: {server.rate_limiter.total.rate:.2f}/s | "
+            f"Request Rate: {request_rate:.2f}/s | "
+            f"Response Rate: {response_rate:.2f}/s | "
+            f"Progress: {progress:.2f}%"
+        )
+        logger.info(stats_line)
+        await asyncio.sleep(1)
+
+def is_rate_limit_error(error_message):
+    # Same signs of rate limiting as constant_rate_scrapper.py watches for
+    return "contentEncodingError" in error_message or "about:neterror" in error_message
+
+class ResultWriter:
+    """Parses returned pages and appends them to the success / failed CSV files."""
+
+    success_csv_fields = [
+        "url",
+        "datetime",
+        "ticker_symbols",
+        "author",
+        "source",
+        "source_url",
+        "title",
+        "article",
+    ]
+    failed_csv_fields = ["url", "error"]
+
+    def __init__(self, website):
+        try:
+            self.extractor_module = import_module(f"extractors.{website}")
+        except ImportError:
+            logger.error(f"Extractor module for website '{website}' not found.")
+            sys.exit(1)
+        success_csv_file = f"success_articles_{website}.csv"
+        failed_csv_file = f"failed_articles_{website}.csv"
+
+        # Open CSV files in append mode
+        success_file_exists = os.path.exists(success_csv_file)
+        failed_file_exists = os.path.exists(failed_csv_file)
+        self.success_csv = open(success_csv_file, "a", newline="", encoding="utf-8")
+        self.failed_csv = open(failed_csv_file, "a", newline="", encoding="utf-8")
+        self.success_writer = csv.DictWriter(self.success_csv, fieldnames=self.success_csv_fields)
+        self.failed_writer = csv.DictWriter(self.failed_csv, fieldnames=self.failed_csv_fields)
+        # Write headers if files are empty
+        if not success_file_exists or os.stat(success_csv_file).st_size == 0:
+            self.success_writer.writeheader()
+        if not failed_file_exists or os.stat(failed_csv_file).st_size == 0:
+            self.failed_writer.writeheader()
+
+    def write_failed(self, url, error_message):
+        row = {field: {"url": url, "error": error_message}.get(field, "") for field in self.failed_csv_fields}
+        self.failed_writer.writerow(row)
+        self.failed_csv.flush()
+        logger.error(f"Failed to scrape {url}: {error_message}")
+
+    def write(self, url, html_content):
+        # Returns "rate_limit" when the page is the site's rate limit notice
+        try:
+            if html_content.startswith("ERROR:"):
+                # This is an error from the client
+                self.write_failed(url, html_content[6:])
+                return
+
+            soup = BeautifulSoup(html_content, "html.parser")
+            data = self.extractor_module.extract_article_data(soup)
+            if "rate_limit_reached" in data.get("error", "").lower():
+                # Not the article but the site's rate limit page, nothing to record
+                return "rate_limit"
+            title = data.get("title", "")
+            if not title:
+                self.write_failed(url, "Title is empty")
+                return
+
+            data["url"] = url
+            row = {field: data.get(field, "") for field in self.success_csv_fields}
+            self.success_writer.writerow(row)
+            self.success_csv.flush()
+            logger.info(f"Successfully scraped {url}")
+        except Exception as e:
+            self.write_failed(url, str(e))
+
+    def close(self):
+        self.success_csv.close()
+        self.failed_csv.close()
+
+class TokenBucket:
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = max(1.0, rate * TOKEN_BURST_SECONDS)
+        self.updated = time.time()
+
+    def refill(self, now):
+        burst = max(1.0, self.rate * TOKEN_BURST_SECONDS)
+        self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, n, now):
+        self.refill(now)
+        granted = max(0, min(n, int(self.tokens)))
+        self.tokens -= granted
+        return granted
+
+    def give_back(self, n):
+        self.tokens += n
+
+    def wait_time(self, now):
+        # Seconds until a whole token is available again
+        self.refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class ClusterRateLimiter:
+    """Owns the request budget of every client against the scraped site.
+
+    Clients draw one token per URL with each task batch, from both the global
+    bucket and the bucket of the egress IP they fetch from. A rate limit seen
+    by any client halves the global rate and pauses that egress IP. The rate
+    then grows back step by step.
+    """
+
+    def __init__(self, total_rate=GLOBAL_REQUEST_RATE, per_ip_rate=PER_IP_REQUEST_RATE):
+        self.total_rate = total_rate
+        self.per_ip_rate = per_ip_rate
+        self.scale = 1.0
+        self.total = TokenBucket(total_rate)
+        self.per_ip = {}
+        self.paused_until = {}
+        self.last_cut = 0.0
+
+    def bucket(self, egress_ip):
+        if egress_ip not in self.per_ip:
+            self.per_ip[egress_ip] = TokenBucket(self.per_ip_rate)
+        return self.per_ip[egress_ip]
+
+    def acquire(self, egress_ip, n, now):
+        if self.paused_until.get(egress_ip, 0) > now:
+            return 0
+        ip_bucket = self.bucket(egress_ip)
+        granted = ip_bucket.take(n, now)
+        total_granted = self.total.take(granted, now)
+        ip_bucket.give_back(granted - total_granted)
+        return total_granted
+
+    def refund(self, egress_ip, n):
+        # Tokens drawn for URLs that were not there to hand out
+        if n:
+            self.total.give_back(n)
+            self.bucket(egress_ip).give_back(n)
+
+    def retry_after(self, egress_ip, now):
+        paused = max(0.0, self.paused_until.get(egress_ip, 0) - now)
+        return max(paused, self.total.wait_time(now), self.bucket(egress_ip).wait_time(now))
+
+    def observe_rate_limit(self, egress_ip, now):
+        self.paused_until[egress_ip] = now + RATE_LIMIT_WAIT
+        # In-flight requests of the same burst all come back rate limited, cut once per burst
+        if now - self.last_cut < RATE_LIMIT_COOLDOWN:
+            return
+        self.last_cut = now
+        self.scale = max(0.05, self.scale * RATE_LIMIT_BACKOFF)
+        self.total.refill(now)
+        self.total.rate = self.total_rate * self.scale
+        logger.warning(
+            f"Rate limit observed from {egress_ip}, global rate cut to {self.total.rate:.2f}/s"
+        )
+
+    def recover(self, now):
+        if self.scale >= 1.0 or now - self.last_cut < RATE_RECOVERY_INTERVAL:
+            return
+        self.scale = min(1.0, self.scale + RATE_RECOVERY_STEP)
+        self.total.refill(now)
+        self.total.rate = self.total_rate * self.scale
+
+class TaskStore:
+    """SQLite copy of the task queue, the leases and what has been completed.
+
+    Every change the LeaseTable makes is mirrored here and committed in groups
+    by Server.commit_store(). On restart the server resumes from this file
+    instead of rebuilding the queue from the CSV files. A URL moves through
+    the states pending -> leased -> received -> done. 'received' means the
+    result is in memory but not yet written to the CSV files, so after a crash
+    it counts as pending again.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                url TEXT PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                updated REAL
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state);
+            CREATE TABLE IF NOT EXISTS leases (
+                url TEXT NOT NULL,
+                client_id TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                issued_at REAL NOT NULL,
+                PRIMARY KEY (url, client_id)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        self.conn.commit()
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def add_urls(self, urls):
+        # Known URLs keep their state, so re-importing a CSV only adds new work
+        before = self.conn.total_changes
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO tasks (url, state, updated) VALUES (?, 'pending', ?)",
+            ((url, time.time()) for url in urls),
+        )
+        self.conn.commit()
+        return self.conn.total_changes - before
+
+    def recover(self):
+        # Results that never reached the CSV files have to be scraped again
+        self.conn.execute("UPDATE tasks SET state = 'pending' WHERE state = 'received'")
+        self.conn.execute(
+            "DELETE FROM leases WHERE url NOT IN (SELECT url FROM tasks WHERE state = 'leased')"
+        )
+        self.conn.execute(
+            "UPDATE tasks SET state = 'pending' WHERE state = 'leased' "
+            "AND url NOT IN (SELECT url FROM leases)"
+        )
+        self.conn.commit()
+        pending = [row[0] for row in self.conn.execute("SELECT url FROM tasks WHERE state = 'pending'")]
+        leases = self.conn.execute("SELECT url, client_id, expires_at, issued_at FROM leases").fetchall()
+        return pending, leases
+
+    def is_done(self, url):
+        row = self.conn.execute("SELECT state FROM tasks WHERE url = ?", (url,)).fetchone()
+        return row is not None and row[0] == 'done'
+
+    def count(self, state):
+        return self.conn.execute("SELECT COUNT(*) FROM tasks WHERE state = ?", (state,)).fetchone()[0]
+
+    def set_state(self, url, state):
+        self.conn.execute("UPDATE tasks SET state = ?, updated = ? WHERE url = ?", (state, time.time(), url))
+
+    def put_lease(self, url, client_id, expires_at, issued_at):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO leases (url, client_id, expires_at, issued_at) VALUES (?, ?, ?, ?)",
+            (url, client_id, expires_at, issued_at),
+        )
+
+    def delete_lease(self, url, client_id=None):
+        if client_id is None:
+            self.conn.execute("DELETE FROM leases WHERE url = ?", (url,))
+        else:
+            self.conn.execute("DELETE FROM leases WHERE url = ? AND client_id = ?", (url, client_id))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+class LeaseTable:
+    """Tracks which client holds which URL, until when, and which URLs are done.
+
+    A URL is handed out under a lease that expires after LEASE_DURATION unless
+    the holder renews it with a heartbeat. Expired URLs go back to the queue.
+    Once the queue runs dry, URLs held for longer than STRAGGLER_AGE are also
+    leased to other clients. The first result wins and later copies are dropped.
+    """
+
+    def __init__(self, url_queue, store):
+        self.url_queue = url_queue
+        self.store = store
+        self.holders = {}    # url -> {client_id: expires_at}
+        self.issued_at = {}  # url -> time the first lease was granted
+        self.by_client = {}  # client_id -> set of urls
+        self.completed = set()
+        # Task batches are numbered so a heartbeat can tell which grants it already knew of
+        self.last_batch = int(store.get_meta('last_batch') or 0)
+        self.lease_batch = {}  # (url, client_id) -> batch the lease was granted in
+
+    def restore(self, url, client_id, expires_at, issued_at):
+        # A lease recovered from the store, kept for the client to reconnect and renew
+        self.holders.setdefault(url, {})[client_id] = expires_at
+        self.issued_at[url] = min(issued_at, self.issued_at.get(url, issued_at))
+        self.by_client.setdefault(client_id, set()).add(url)
+
+    def new_batch(self):
+        # Kept in the store, so numbers keep growing across server restarts
+        self.last_batch += 1
+        self.store.set_meta('last_batch', str(self.last_batch))
+        return self.last_batch
+
+    def grant(self, url, client_id, now, batch=0):
+        self.holders.setdefault(url, {})[client_id] = now + LEASE_DURATION
+        self.lease_batch[(url, client_id)] = batch
+        self.issued_at.setdefault(url, now)
+        self.by_client.setdefault(client_id, set()).add(url)
+        self.store.set_state(url, 'leased')
+        self.store.put_lease(url, client_id, now + LEASE_DURATION, self.issued_at[url])
+
+    def renew(self, client_id, urls, now, batch=None):
+        # Leases the client no longer reports have been lost on its side. batch is the
+        # last task batch the client had when it listed its URLs; leases granted in a
+        # later batch were still on their way and are left to the next heartbeat.
+        urls = set(urls)
+        for url in self.held_by(client_id):
+            if url in urls:
+                self.holders[url][client_id] = now + LEASE_DURATION
+                self.store.put_lease(url, client_id, now + LEASE_DURATION, self.issued_at[url])
+            elif batch is None or self.lease_batch.get((url, client_id), 0) <= batch:
+                self.drop(url, client_id)
+
+    def held_by(self, client_id):
+        return list(self.by_client.get(client_id, ()))
+
+    def drop(self, url, client_id):
+        holders = self.holders.get(url)
+        if holders is None or client_id not in holders:
+            return
+        del holders[client_id]
+        self.lease_batch.pop((url, client_id), None)
+        self.by_client[client_id].discard(url)
+        self.store.delete_lease(url, client_id)
+        if not holders:
+            del self.holders[url]
+            del self.issued_at[url]
+            if url not in self.completed:
+                self.store.set_state(url, 'pending')
+                self.url_queue.put_nowait(url)
+
+    def release(self, client_id):
+        for url in self.held_by(client_id):
+            self.drop(url, client_id)
+        self.by_client.pop(client_id, None)
+
+    def complete(self, url):
+        """Returns False when the URL was already completed by another client."""
+        if url in self.completed or self.store.is_done(url):
+            return False
+        self.completed.add(url)
+        for client_id in self.holders.pop(url, {}):
+            self.by_client[client_id].discard(url)
+            self.lease_batch.pop((url, client_id), None)
+        self.issued_at.pop(url, None)
+        self.store.delete_lease(url)
+        self.store.set_state(url, 'received')
+        return True
+
+    def persisted(self, url):
+        # The result has been written to the CSV files
+        self.store.set_state(url, 'done')
+
+    def reopen(self, url):
+        # The result was a rate limit page, the URL itself still needs scraping
+        self.completed.discard(url)
+        self.store.set_state(url, 'pending')
+        self.url_queue.put_nowait(url)
+
+    def expire(self, now):
+        expired = [
+            (url, client_id)
+            for url, holders in self.holders.items()
+            for client_id, expires_at in holders.items()
+            if expires_at <= now
+        ]
+        for url, client_id in expired:
+            logger.warning(f"Lease on {url} held by {client_id} expired")
+            self.drop(url, client_id)
+        return len(expired)
+
+    def stragglers(self, client_id, limit, now):
+        # Oldest first, so the URL stalling the tail the longest goes out first
+        candidates = sorted(
+            (issued_at, url) for url, issued_at in self.issued_at.items()
+            if now - issued_at >= STRAGGLER_AGE
+            and client_id not in self.holders[url]
+            and len(self.holders[url]) < MAX_LEASE_COPIES
+        )
+        return [url for _, url in candidates[:limit]]
+
+class ClientConnection:
+    """State of one worker connection; all methods run on the server's event loop."""
+
+    def __init__(self, reader, writer, server):
+        self.reader = reader
+        self.writer = writer
         self.server = server
-        self.stop_event = threading.Event()
-        self.assigned_urls = set()
-        self.lock = threading.Lock()
+        self.addr = writer.get_extra_info('peername')
+        self.client_id = f"{self.addr[0]}:{self.addr[1]}"
+        # Clients behind a proxy or NAT report the address they fetch from
+        self.egress_ip = self.addr[0]
+        # Set once the client introduced itself with a stable id
+        self.registered = False
 
-    def return_unprocessed_urls(self):
-        with self.lock:
-            for url in self.assigned_urls:
-                self.server.url_queue.put(url)
-            self.assigned_urls.clear()
+    async def send(self, message):
+        self.writer.write((json.dumps(message) + '\n').encode('utf-8'))
+        # Waits only when this client's socket buffer is full, so a slow
+        # reader stalls its own coroutine and nobody else's
+        await self.writer.drain()
+
+    async def handle_request_tasks(self, msg):
+        leases = self.server.leases
+        rate_limiter = self.server.rate_limiter
+        now = time.time()
+        self.egress_ip = msg.get('egress_ip') or self.egress_ip
+        # A client never holds more than MAX_INFLIGHT_PER_CLIENT URLs at once,
+        # and every URL handed out spends a token of the cluster-wide budget
+        num_urls_requested = rate_limiter.acquire(self.egress_ip, min(
+            msg.get('num_urls', 0),
+            MAX_INFLIGHT_PER_CLIENT - len(leases.held_by(self.client_id)),
+        ), now)
+        urls_assigned = []
+        while len(urls_assigned) < num_urls_requested:
+            try:
+                url = self.server.url_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            # Requeued by an expired lease but finished by its late holder since
+            if url in leases.completed:
+                continue
+            urls_assigned.append(url)
+        if len(urls_assigned) < num_urls_requested:
+            # Nothing left to hand out: duplicate the oldest outstanding work
+            urls_assigned.extend(leases.stragglers(
+                self.client_id, num_urls_requested - len(urls_assigned), now
+            ))
+        # An empty batch grants nothing, so it needs no number of its own
+        batch = leases.new_batch() if urls_assigned else leases.last_batch
+        for url in urls_assigned:
+            leases.grant(url, self.client_id, now, batch)
+        rate_limiter.refund(self.egress_ip, num_urls_requested - len(urls_assigned))
+        # When the client may ask again without coming back empty-handed. With
+        # nothing to hand out the buckets are full, so idle clients are slowed down here.
+        retry_after = rate_limiter.retry_after(self.egress_ip, time.time())
+        if not urls_assigned:
+            retry_after = max(retry_after, EMPTY_BATCH_RETRY)
+        await self.send({
+            'type': 'task_batch',
+            'batch': batch,
+            'urls': urls_assigned,
+            'lease_seconds': LEASE_DURATION,
+            'retry_after': retry_after,
+        })
+        self.server.stats_tracker.record_request()
+        logger.info(f"Assigned {len(urls_assigned)} tasks to {self.addr}")
 
-    def run(self):
+    async def handle_result(self, msg):
+        url = msg.get('url')
+        html_content = msg.get('html_content') or ""
+        if html_content.startswith("ERROR:") and is_rate_limit_error(html_content):
+            self.server.rate_limiter.observe_rate_limit(self.egress_ip, time.time())
+        if not self.server.leases.complete(url):
+            # A late copy from a client whose lease expired or was duplicated
+            logger.info(f"Ignoring duplicate result for URL: {url} from {self.addr}")
+            return
+        # Blocks while the persistence stage is behind; we stop reading from
+        # this socket meanwhile, which pushes back on the client through TCP
+        await self.server.result_queue.put((url, html_content, self.egress_ip))
+        self.server.stats_tracker.record_response()
+        logger.info(f"Received result for URL: {url} from {self.addr}")
+
+    async def run(self):
         try:
-            while not self.stop_event.is_set():
-                data = self.conn.recv(4096)
-                if not data:
+            while not self.server.stop_event.is_set():
+                line = await self.reader.readline()
+                if not line:
                     break
-                messages = data.decode('utf-8').split('\n')
-                for message in messages:
-                    if not message.strip():
-                        continue
-                    try:
-                        msg = json.loads(message)
-                        print(message)
-                    except json.JSONDecodeError as e:
-                        logger.error(f"JSON decode error from {self.addr}: {e}")
-                        continue
-                    if msg['type'] == 'request_tasks':
-                        num_urls_requested = msg.get('num_urls', 0)
-                        urls_assigned = []
-                        for _ in range(num_urls_requested):
-                            try:
-                                url = self.server.url_queue.get_nowait()
-                                urls_assigned.append(url)
-                                with self.lock:
-                                    self.assigned_urls.add(url)
-                            except queue.Empty:
-                                break
-                        task = {'type': 'task_batch', 'urls': urls_assigned}
-                        self.conn.sendall((json.dumps(task) + '\n').encode('utf-8'))
-                        self.server.stats_tracker.record_request()
-                        logger.info(f"Assigned {len(urls_assigned)} tasks to {self.addr}")
-                    elif msg['type'] == 'result':
-                        url = msg.get('url')
-                        html_content = msg.get('html_content')
-                        with self.lock:
-                            self.assigned_urls.discard(url)
-                        self.server.result_queue.put((url, html_content))
-                        self.server.stats_tracker.record_response()
-                        logger.info(f"Received result for URL: {url} from {self.addr}")
-                    elif msg['type'] == 'tasks_completed':
-                        # Optional: Handle task completion acknowledgment
-                        self.conn.sendall((json.dumps({'type': 'acknowledge_completion'}) + '\n').encode('utf-8'))
-                        self.stop_event.set()
-                        logger.info(f"Client {self.addr} has completed all tasks.")
-                        break
-                    else:
-                        logger.error(f"Unknown message type from client {self.addr}: {msg}")
-        except (ConnectionResetError, BrokenPipeError) as e:
+                if not line.strip():
+                    continue
+                try:
+                    msg = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.error(f"JSON decode error from {self.addr}: {e}")
+                    continue
+                if msg['type'] == 'hello':
+                    # A stable id lets a reconnecting client (or one that outlived a
+                    # server restart) keep renewing the leases it already holds
+                    self.client_id = msg.get('client_id') or self.client_id
+                    self.egress_ip = msg.get('egress_ip') or self.egress_ip
+                    self.registered = True
+                    logger.info(f"Client {self.addr} is {self.client_id}")
+                elif msg['type'] == 'request_tasks':
+                    await self.handle_request_tasks(msg)
+                elif msg['type'] == 'result':
+                    await self.handle_result(msg)
+                elif msg['type'] == 'rate_limit':
+                    self.server.rate_limiter.observe_rate_limit(self.egress_ip, time.time())
+                elif msg['type'] == 'heartbeat':
+                    # The client lists every URL it still holds, queued or in progress
+                    self.server.leases.renew(
+                        self.client_id, msg.get('urls', []), time.time(), msg.get('batch')
+                    )
+                elif msg['type'] == 'tasks_completed':
+                    self.registered = False
+                    await self.send({'type': 'acknowledge_completion'})
+                    logger.info(f"Client {self.addr} has completed all tasks.")
+                    break
+                else:
+                    logger.error(f"Unknown message type from client {self.addr}: {msg}")
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError) as e:
             logger.warning(f"Client {self.addr} disconnected unexpectedly: {e}")
+        except ValueError as e:
+            # readline() raises ValueError once a line outgrows the stream limit
+            logger.error(f"Message from {self.addr} exceeds {MAX_MESSAGE_SIZE} bytes: {e}")
         except Exception as e:
             logger.error(f"Error with client {self.addr}: {e}")
         finally:
-            self.return_unprocessed_urls()
-            self.conn.close()
+            # Registered clients reconnect and carry on, their leases just run out if they don't
+            if not self.registered:
+                self.server.leases.release(self.client_id)
+            self.writer.close()
             logger.info(f"Client {self.addr} disconnected.")
 
 class Server:
     def __init__(self):
-        self.clients = []
-        self.url_queue = queue.Queue()
-        self.result_queue = queue.Queue()
+        self.clients = set()
+        self.url_queue = asyncio.Queue()
+        self.result_queue = asyncio.Queue(maxsize=RESULT_QUEUE_SIZE)
+        self.store = TaskStore(f"tasks_{WEBSITE}.db")
+        self.leases = LeaseTable(self.url_queue, self.store)
+        self.rate_limiter = ClusterRateLimiter()
         self.stats_tracker = StatsTracker()
-        self.stats_lock = threading.Lock()
         self.total_urls = 0
-        self.stop_event = threading.Event()
-
-    def load_urls(self):
-        website = "yfin"
-
-        # Read the CSV file to get the URLs
-        input_csv_file = "yahoo_links_new.csv"
-        if not os.path.exists(input_csv_file):
-            logger.error(f"Input CSV file '{input_csv_file}' not found.")
-            sys.exit(1)
+        # Set once every URL has been completed and written
+        self.finished = False
+        self.stop_event = asyncio.Event()
 
+    def import_urls(self, input_csv_file):
+        # Only runs when the input CSV is new or has changed since the last import
+        website = WEBSITE
         df_links = pd.read_csv(input_csv_file)
         # Read already scraped URLs from success and failed CSV files
         scraped_urls = set()
         success_csv_file = f"success_articles_{website}.csv"
         failed_csv_file = f"failed_articles_{website}.csv"
         if os.path.exists(success_csv_file):
-            df_success_existing = pd.read_csv(success_csv_file)
+            df_success_existing = pd.read_csv(success_csv_file, usecols=["url"])
             scraped_urls.update(df_success_existing["url"].astype(str).tolist())
         if os.path.exists(failed_csv_file):
-            df_failed_existing = pd.read_csv(failed_csv_file)
+            df_failed_existing = pd.read_csv(failed_csv_file, usecols=["url"])
             scraped_urls.update(df_failed_existing["url"].astype(str).tolist())
-        # Filter out already scraped URLs
-        df_links = df_links[~df_links["url"].astype(str).isin(scraped_urls)]
-        # Convert 'url' column to list
-        urls = df_links["url"].astype(str).tolist()
-        self.total_urls = len(urls)
-        logger.info(f"Total URLs to scrape: {self.total_urls}")
-        for url in urls:
-            self.url_queue.put(url)
+        # Filter out already scraped URLs, compared by canonical form so variants
+        # of a scraped URL (http/https, :80, query strings) are not fetched again
+        df_links = url_canon.canonicalize_frame(df_links, "url")
+        df_links = df_links[url_canon.unseen_mask(df_links["url"], list(scraped_urls))]
+        added = self.store.add_urls(df_links["url"].tolist())
+        logger.info(f"Imported {added} new URLs from {input_csv_file}")
 
-    def start(self):
-        # Handle Ctrl+C gracefully
-        def signal_handler(sig, frame):
-            logger.info("Exiting gracefully...")
-            self.stop_event.set()
-            sys.exit(0)
-
-        signal.signal(signal.SIGINT, signal_handler)
-
-        # Load URLs
-        self.load_urls()
+    def load_urls(self):
+        # Read the CSV file to get the URLs
+        input_csv_file = "yahoo_links_new.csv"
+        if os.path.exists(input_csv_file):
+            stat = os.stat(input_csv_file)
+            signature = f"{stat.st_mtime_ns}:{stat.st_size}"
+            if self.store.get_meta(input_csv_file) != signature:
+                self.import_urls(input_csv_file)
+                self.store.set_meta(input_csv_file, signature)
+        elif not self.store.count('pending') and not self.store.count('leased'):
+            logger.error(f"Input CSV file '{input_csv_file}' not found.")
+            sys.exit(1)
 
-        # Start stats display thread
-        stats_thread = threading.Thread(
-            target=display_stats,
-            args=(self.stats_tracker, self.total_urls, self.stop_event),
-            daemon=True
+        # Resume from the task store: pending URLs are queued, leases are kept
+        # until their holders reconnect and renew them or they run out
+        pending, leases = self.store.recover()
+        for url in pending:
+            self.url_queue.put_nowait(url)
+        for url, client_id, expires_at, issued_at in leases:
+            self.leases.restore(url, client_id, expires_at, issued_at)
+        self.total_urls = len(pending) + len(self.leases.holders)
+        logger.info(
+            f"Total URLs to scrape: {self.total_urls} "
+            f"({len(self.leases.holders)} still leased, {self.store.count('done')} done)"
         )
-        stats_thread.start()
-
-        # Start server socket
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((HOST, PORT))
-            s.listen(MAX_CLIENTS)
-            s.settimeout(1.0)  # To allow periodic checks for stop_event
-            logger.info(f"Server listening on {HOST}:{PORT}")
-            while not self.stop_event.is_set():
-                try:
-                    conn, addr = s.accept()
-                    logger.info(f"Connected by {addr}")
-                    client_thread = ClientHandlerThread(conn, addr, self)
-                    client_thread.start()
-                    self.clients.append(client_thread)
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    logger.error(f"Error accepting connections: {e}")
-                    break
 
-        # Wait for all clients to finish
-        for client in self.clients:
-            client.stop_event.set()
-            client.join()
+    def has_queued_work(self):
+        # The queue can still hold URLs requeued by an expired lease and completed since
+        while not self.url_queue.empty():
+            url = self.url_queue.get_nowait()
+            if url not in self.leases.completed:
+                self.url_queue.put_nowait(url)
+                return True
+        return False
+
+    async def handle_client(self, reader, writer):
+        client = ClientConnection(reader, writer, self)
+        logger.info(f"Connected by {client.addr}")
+        self.clients.add(client)
+        try:
+            await client.run()
+        finally:
+            self.clients.discard(client)
 
-        # Process results
-        self.process_results()
+    async def expire_leases(self):
+        while True:
+            await asyncio.sleep(LEASE_CHECK_INTERVAL)
+            self.rate_limiter.recover(time.time())
+            expired = self.leases.expire(time.time())
+            if expired:
+                logger.warning(f"Re-queued {expired} URLs from expired leases")
 
-        # Stop threads
-        self.stop_event.set()
-        stats_thread.join()
+    async def commit_store(self):
+        while True:
+            await asyncio.sleep(STORE_COMMIT_INTERVAL)
+            self.store.commit()
 
-    def process_results(self):
-        website = "yfin"
+    async def persist_results(self):
+        # The persistence stage: results are parsed and written while the crawl
+        # is still running instead of after every client has gone away
+        result_writer = ResultWriter(WEBSITE)
+        loop = asyncio.get_running_loop()
         try:
-            extractor_module = import_module(f"extractors.{website}")
-        except ImportError:
-            logger.error(f"Extractor module for website '{website}' not found.")
-            sys.exit(1)
-        success_csv_file = f"success_articles_{website}.csv"
-        failed_csv_file = f"failed_articles_{website}.csv"
-        success_csv_fields = [
-            "url",
-            "datetime",
-            "ticker_symbols",
-            "author",
-            "source",
-            "source_url",
-            "title",
-            "article",
-        ]
-        failed_csv_fields = ["url", "error"]
+            while True:
+                url, html_content, egress_ip = await self.result_queue.get()
+                # BeautifulSoup parsing is CPU bound, keep it off the event loop
+                status = await loop.run_in_executor(None, result_writer.write, url, html_content)
+                if status == "rate_limit":
+                    self.rate_limiter.observe_rate_limit(egress_ip, time.time())
+                    self.leases.reopen(url)
+                else:
+                    self.leases.persisted(url)
+                self.result_queue.task_done()
+                if len(self.leases.completed) >= self.total_urls and self.result_queue.empty():
+                    logger.info("All URLs processed.")
+                    self.finished = True
+                    self.stop_event.set()
+        finally:
+            result_writer.close()
 
-        # Open CSV files in append mode
-        success_csv_lock = threading.Lock()
-        failed_csv_lock = threading.Lock()
-        success_file_exists = os.path.exists(success_csv_file)
-        failed_file_exists = os.path.exists(failed_csv_file)
-        success_csv = open(success_csv_file, "a", newline="", encoding="utf-8")
-        failed_csv = open(failed_csv_file, "a", newline="", encoding="utf-8")
-        success_writer = csv.DictWriter(success_csv, fieldnames=success_csv_fields)
-        failed_writer = csv.DictWriter(failed_csv, fieldnames=failed_csv_fields)
-        # Write headers if files are empty
-        if not success_file_exists or os.stat(success_csv_file).st_size == 0:
-            success_writer.writeheader()
-        if not failed_file_exists or os.stat(failed_csv_file).st_size == 0:
-            failed_writer.writeheader()
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        # Handle Ctrl+C gracefully
+        loop.add_signal_handler(signal.SIGINT, self.stop_event.set)
 
-        # Process results from result_queue
-        while not self.result_queue.empty():
-            url, html_content = self.result_queue.get()
-            try:
-                if html_content.startswith("ERROR:"):
-                    # This is an error from the client
-                    error_message = html_content[6:]
-                    data = {"url": url, "error": error_message}
-                    with failed_csv_lock:
-                        row = {field: data.get(field, "") for field in failed_csv_fields}
-                        failed_writer.writerow(row)
-                        failed_csv.flush()
-                    logger.error(f"Failed to scrape {url}: {error_message}")
-                    continue
+        # Load URLs
+        self.load_urls()
 
-                soup = BeautifulSoup(html_content, "html.parser")
-                data = extractor_module.extract_article_data(soup)
-                title = data.get("title", "")
-                if not title:
-                    error_message = "Title is empty"
-                    data = {"url": url, "error": error_message}
-                    with failed_csv_lock:
-                        row = {field: data.get(field, "") for field in failed_csv_fields}
-                        failed_writer.writerow(row)
-                        failed_csv.flush()
-                    logger.error(f"Failed to scrape {url}: {error_message}")
-                    continue
+        stats_task = asyncio.create_task(display_stats(self))
+        persist_task = asyncio.create_task(self.persist_results())
+        lease_task = asyncio.create_task(self.expire_leases())
+        commit_task = asyncio.create_task(self.commit_store())
+
+        server = await asyncio.start_server(
+            self.handle_client, HOST, PORT,
+            limit=MAX_MESSAGE_SIZE, backlog=LISTEN_BACKLOG,
+        )
+        logger.info(f"Server listening on {HOST}:{PORT}")
+        async with server:
+            await self.stop_event.wait()
+            logger.info("Exiting gracefully...")
+            # Hang up on the remaining clients; their leases stay in the store
+            # so they can pick up where they left off with the next server.
+            # When the crawl is done they are told so, and stop instead of reconnecting.
+            done = self.finished and not self.has_queued_work() and not self.leases.holders
+            for client in list(self.clients):
+                if done:
+                    try:
+                        await client.send({'type': 'no_task'})
+                    except (ConnectionError, OSError) as e:
+                        logger.warning(f"Could not send no_task to {client.addr}: {e}")
+                client.writer.close()
+            while self.clients:
+                await asyncio.sleep(0.1)
 
-                data["url"] = url
-                with success_csv_lock:
-                    row = {field: data.get(field, "") for field in success_csv_fields}
-                    success_writer.writerow(row)
-                    success_csv.flush()
-                logger.info(f"Successfully scraped {url}")
-            except Exception as e:
-                error_message = str(e)
-                data = {"url": url, "error": error_message}
-                with failed_csv_lock:
-                    row = {field: data.get(field, "") for field in failed_csv_fields}
-                    failed_writer.writerow(row)
-                    failed_csv.flush()
-                logger.error(f"Error processing result for {url}: {error_message}")
-
-        # Close CSV files
-        success_csv.close()
-        failed_csv.close()
+        # Flush everything already received before shutting down
+        await self.result_queue.join()
+        persist_task.cancel()
+        stats_task.cancel()
+        lease_task.cancel()
+        commit_task.cancel()
+        await asyncio.gather(persist_task, stats_task, lease_task, commit_task, return_exceptions=True)
+        self.store.close()
+
+    def start(self):
+        asyncio.run(self.serve())
 
 if __name__ == "__main__":
     server = Server()
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 
+import url_canon
+
 # Input parameters
 input_file = 'yahoo_new_urls_2025.csv'
 output_prefix = 'parts/yfin_2025'
@@ -12,7 +14,8 @@ def split_csv(input_file, output_prefix, num_parts):
     df = pd.read_csv(input_file)
     drop_df = pd.read_csv(drop_file)
     print(df)
-    df = df[~df['url'].isin(drop_df['url'])]
+    df = url_canon.canonicalize_frame(df, 'url')
+    df = df[url_canon.unseen_mask(df['url'], drop_df['url'])]
     print(df)
 
     
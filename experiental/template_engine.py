@@ -0,0 +1,151 @@
+import copy
+import json
+import logging
+
+import soupsieve as sv
+
+# Compiles the extraction templates of templates.json once into plans that every worker reuses.
+# A template maps a field to either a CSS selector (text of the first match) or a spec
+# {'selector', 'attribute', 'index', 'inner'}: the attribute ('text' for the text) of every
+# match, or of the matches at the listed indices, or for 'inner' the inner spec applied
+# inside each match. A spec without 'attribute' uses default_attribute; with none, the
+# field fails like the old extract_elements did on selector_info['attribute'].
+
+TEMPLATES_FILE = 'templates.json'
+SPEC_KEYS = {'selector', 'attribute', 'index', 'inner'}
+
+
+class TemplateError(ValueError):
+    """A template that does not follow the selector spec format."""
+
+
+def compile_selector(selector, path):
+    try:
+        return sv.compile(selector)
+    except sv.SelectorSyntaxError as e:
+        raise TemplateError(f"{path}: invalid selector {selector!r}: {e}")
+
+
+class SelectorSpec:
+    """One compiled selector spec. limit is how many matches are needed, 0 for all.
+
+    missing is the value of a match without the attribute.
+    """
+
+    def __init__(self, spec, path, default_attribute=None, missing=None):
+        if not isinstance(spec, dict):
+            raise TemplateError(f"{path}: expected a selector or a spec, got {spec!r}")
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise TemplateError(f"{path}: unknown keys {sorted(unknown)}")
+        if not isinstance(spec.get('selector'), str):
+            raise TemplateError(f"{path}: 'selector' must be a string")
+        self.selector_text = spec['selector']
+        self.selector = compile_selector(self.selector_text, path)
+        self.path = path
+        self.attribute = spec.get('attribute', default_attribute)
+        self.missing = missing
+        self.index = spec.get('index') or []
+        if not isinstance(self.index, list) or not all(isinstance(i, int) for i in self.index):
+            raise TemplateError(f"{path}: 'index' must be a list of integers")
+        self.inner = (SelectorSpec(spec['inner'], path + '.inner', default_attribute, missing)
+                      if spec.get('inner') else None)
+        # Only the first max(index) + 1 matches are needed, unless an index counts from the end
+        self.limit = max(self.index) + 1 if self.index and min(self.index) >= 0 else 0
+
+    def values(self, elements):
+        if self.attribute is None:
+            raise KeyError(f"{self.path}: no 'attribute'")
+        if self.index:
+            elements = [elements[i] for i in self.index if i < len(elements)]
+        value = []
+        for element in elements:
+            if self.inner is not None:
+                value.append(self.inner.extract(element))
+            elif self.attribute == 'text':
+                value.append(element.get_text(strip=True))
+            else:
+                value.append(element.get(self.attribute, self.missing))
+        return value
+
+    def extract(self, parent):
+        elements = self.selector.select(parent, limit=self.limit)
+        if not elements:
+            logging.debug(f"No elements found for selector: {self.selector_text}")
+        return self.values(elements)
+
+
+class TemplatePlan:
+    """A validated, compiled template.
+
+    Selectors are compiled once, and each is run with the number of matches
+    its fields need, so a first-match field stops at the first element.
+    Fields using the same selector share one search per page; there is no
+    shared ancestor scoping or single tree walk across fields, since matching
+    every node against every field in one walk measured about 2x slower.
+    """
+
+    def __init__(self, template, default_attribute=None, missing=None):
+        if not isinstance(template, dict):
+            raise TemplateError(f"template must be a dict of fields, got {template!r}")
+        self.fields = []
+        self.searches = {}
+        for field, spec in template.items():
+            first_only = isinstance(spec, str)
+            if first_only:
+                spec = SelectorSpec({'selector': spec, 'attribute': 'text'}, field)
+            else:
+                spec = SelectorSpec(spec, field, default_attribute, missing)
+            limit = 1 if first_only else spec.limit
+            self.fields.append((field, spec, first_only))
+            if spec.selector_text in self.searches:
+                selector, shared = self.searches[spec.selector_text]
+                limit = 0 if 0 in (limit, shared) else max(limit, shared)
+            self.searches[spec.selector_text] = (spec.selector, limit)
+
+    def extract(self, root):
+        """{field: value} of a parsed page; a field that fails is logged and set to ''."""
+        found = {}
+        for selector_text, (selector, limit) in self.searches.items():
+            try:
+                found[selector_text] = selector.select(root, limit=limit)
+            except Exception as e:
+                found[selector_text] = e
+        article_data = {}
+        for field, spec, first_only in self.fields:
+            try:
+                elements = found[spec.selector_text]
+                if isinstance(elements, Exception):
+                    raise elements
+                if first_only:
+                    article_data[field] = elements[0].get_text(strip=True) if elements else ''
+                else:
+                    article_data[field] = spec.values(elements)
+                logging.debug(f"Extracted {field}: {article_data[field][:50]}...")
+            except Exception as e:
+                logging.error(f"Error extracting {field}: {e}")
+                article_data[field] = ''
+        return article_data
+
+
+# Plans of this process by template name, with the template they were compiled from
+plans = {}
+
+
+def get_plan(name, template, default_attribute=None, missing=None):
+    """The compiled plan of a template, compiled again only when the template or the options change."""
+    options = (default_attribute, missing)
+    cached = plans.get(name)
+    if cached is None or cached[0] != template or cached[1] != options:
+        cached = (copy.deepcopy(template), options, TemplatePlan(template, default_attribute, missing))
+        plans[name] = cached
+    return cached[2]
+
+
+def load_templates(path=TEMPLATES_FILE):
+    """{name: template} of a templates file; every template is validated and compiled on load."""
+    with open(path, 'r') as file:
+        templates = json.load(file)
+    for name, template in templates.items():
+        get_plan(name, template)
+    return templates
@@ -0,0 +1,186 @@
+import csv
+import heapq
+import os
+import sys
+import tempfile
+
+# Article bodies easily exceed the csv module's default 128 KiB field limit
+csv.field_size_limit(sys.maxsize)
+
+RUN_ROWS = 200000  # Rows sorted in memory at a time before they are spilled to a run file
+MERGE_FAN_IN = 64  # Run files opened by a single merge
+
+
+def read_csv_rows(path):
+    """Yields the header first, then every row of a CSV file as a list."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        yield from csv.reader(f)
+
+
+def write_csv_rows(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def iter_sorted_file(path):
+    rows = read_csv_rows(path)
+    next(rows, None)  # header
+    return rows
+
+
+def iter_batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def dedup_sorted(rows, key):
+    # Rows with equal keys are adjacent in sorted input, keep the first of each
+    last = object()
+    for row in rows:
+        k = key(row)
+        if k != last:
+            last = k
+            yield row
+
+
+def spill_runs(rows, header, key, run_dir, run_rows=RUN_ROWS, unique=False):
+    """Sorts rows in batches of run_rows and writes each batch to its own run file."""
+    runs = []
+    batch = []
+
+    def flush():
+        batch.sort(key=key)
+        sorted_rows = dedup_sorted(batch, key) if unique else batch
+        fd, path = tempfile.mkstemp(suffix='.csv', dir=run_dir)
+        os.close(fd)
+        write_csv_rows(path, header, sorted_rows)
+        runs.append(path)
+        batch.clear()
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= run_rows:
+            flush()
+    if batch or not runs:
+        flush()
+    return runs
+
+
+def merge_sorted_files(paths, header, key, output_path, unique=False):
+    """k-way merges already sorted CSV files into output_path in bounded memory.
+
+    Ties keep the order of paths, so with unique=True the row from the earliest
+    file wins. Returns the number of rows written.
+    """
+    tmp_path = output_path + '.tmp'
+    count = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        merged = heapq.merge(*(iter_sorted_file(p) for p in paths), key=key)
+        if unique:
+            merged = dedup_sorted(merged, key)
+        for row in merged:
+            writer.writerow(row)
+            count += 1
+    os.replace(tmp_path, output_path)
+    return count
+
+
+def reduce_runs(paths, header, key, run_dir, fan_in=MERGE_FAN_IN, unique=False):
+    """Merges sorted run files fan_in at a time until at most fan_in are left.
+
+    Groups are consecutive, so ties keep the order of paths. The merged
+    inputs are deleted. Returns the remaining run files, in order.
+    """
+    paths = list(paths)
+    while len(paths) > fan_in:
+        merged = []
+        for start in range(0, len(paths), fan_in):
+            group = paths[start:start + fan_in]
+            if len(group) == 1:
+                merged.extend(group)
+                continue
+            fd, path = tempfile.mkstemp(suffix='.csv', dir=run_dir)
+            os.close(fd)
+            merge_sorted_files(group, header, key, path, unique)
+            for p in group:
+                os.remove(p)
+            merged.append(path)
+        paths = merged
+    return paths
+
+
+def sort_csv_file(input_path, output_path, key_column, key_type=str, unique=False, run_rows=RUN_ROWS,
+                  map_rows=None):
+    """External sort of one CSV file on key_column; input and output may be the same file.
+
+    map_rows(header, rows) can rewrite or drop rows before they are sorted; it
+    gets them in batches of up to run_rows, so it can work on whole columns.
+    """
+    rows = read_csv_rows(input_path)
+    header = next(rows, None)
+    if header is None:
+        return 0
+    index = header.index(key_column)
+    if map_rows is not None:
+        rows = (row for batch in iter_batches(rows, run_rows) for row in map_rows(header, batch))
+
+    def key(row):
+        return key_type(row[index])
+
+    run_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        runs = spill_runs(rows, header, key, run_dir, run_rows, unique)
+        runs = reduce_runs(runs, header, key, run_dir, unique=unique)
+        return merge_sorted_files(runs, header, key, output_path, unique)
+    finally:
+        for name in os.listdir(run_dir):
+            os.remove(os.path.join(run_dir, name))
+        os.rmdir(run_dir)
+
+
+def anti_join_sorted(left_path, right_path, key_column, output_path):
+    """Writes the rows of left_path whose key_column value does not appear in right_path.
+
+    Both files must be sorted on key_column; they are read once, side by side.
+    A missing right_path counts as empty. Returns the number of rows written.
+    """
+    left = read_csv_rows(left_path)
+    header = next(left, None)
+    if header is None:
+        return 0
+    left_index = header.index(key_column)
+
+    right = iter(())
+    right_index = 0
+    if os.path.exists(right_path):
+        right = read_csv_rows(right_path)
+        right_header = next(right, None)
+        if right_header:
+            right_index = right_header.index(key_column)
+    right_keys = (row[right_index] for row in right)
+    right_key = next(right_keys, None)
+
+    tmp_path = output_path + '.tmp'
+    count = 0
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for row in left:
+            key = row[left_index]
+            while right_key is not None and right_key < key:
+                right_key = next(right_keys, None)
+            if key != right_key:
+                writer.writerow(row)
+                count += 1
+    os.replace(tmp_path, output_path)
+    return count
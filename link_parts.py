@@ -0,0 +1,122 @@
+import glob
+import json
+import os
+
+import extsort
+import url_canon
+
+LINKS_FOLDER = 'yahoo_links_1'
+SORTED_FOLDER = 'sorted'
+MANIFEST_FILE = 'manifest.json'
+# Version of the sorted copies; older ones hold raw URLs and are sorted again
+MANIFEST_VERSION = 2
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    return {'version': MANIFEST_VERSION, 'parts': {}, 'output': None}
+
+
+def save_manifest(path, manifest):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def url_key(header):
+    index = header.index('url')
+    return lambda row: row[index]
+
+
+def canonical_rows(header, rows):
+    # Legacy parts still hold www. hosts, query strings and other variants of
+    # the canonical URLs newer parts are written with; rejected URLs are dropped
+    index = header.index('url')
+    canonical = url_canon.canonicalize([row[index] for row in rows])
+    return [row[:index] + [url] + row[index + 1:] for row, url in zip(rows, canonical) if url is not None]
+
+
+def merge_link_parts(folder=LINKS_FOLDER, output_file='yfin_urls.csv'):
+    """Merges every yahoo_*.csv part into output_file, unique by url, in bounded memory.
+
+    URLs are compared in canonical form (url_canon.canonicalize), so the
+    variants of an article in older parts collapse into one row.
+    Each part is sorted by url once and the sorted copy is kept in
+    folder/sorted/ together with the part's mtime and size. Only new or changed
+    parts are sorted again. If parts were only added since the last merge, the
+    previous output (sorted as well) is merged with the new parts alone.
+    Returns the number of unique URLs written.
+    """
+    sorted_folder = os.path.join(folder, SORTED_FOLDER)
+    os.makedirs(sorted_folder, exist_ok=True)
+    manifest_path = os.path.join(sorted_folder, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+
+    parts = sorted(glob.glob(os.path.join(folder, '*.csv')))
+    names = [os.path.basename(p) for p in parts]
+    changed = []
+    for part, name in zip(parts, names):
+        signature = file_signature(part)
+        if manifest['parts'].get(name) != signature:
+            try:
+                extsort.sort_csv_file(part, os.path.join(sorted_folder, name), 'url', unique=True,
+                                      map_rows=canonical_rows)
+            except Exception as e:
+                print(f"Error reading {part}: {e}")
+                continue
+            manifest['parts'][name] = signature
+            changed.append(name)
+    removed = [name for name in manifest['parts'] if name not in names]
+    for name in removed:
+        del manifest['parts'][name]
+        sorted_path = os.path.join(sorted_folder, name)
+        if os.path.exists(sorted_path):
+            os.remove(sorted_path)
+    save_manifest(manifest_path, manifest)
+
+    merged_parts = [name for name in names if name in manifest['parts']]
+    if not merged_parts:
+        print("No CSV files were processed. Check if the scraping was successful.")
+        return 0
+
+    previous = manifest['output']
+    header = next(extsort.read_csv_rows(os.path.join(sorted_folder, merged_parts[0])))
+    incremental = (
+        previous is not None
+        and previous['file'] == output_file
+        and os.path.exists(output_file)
+        and previous['signature'] == file_signature(output_file)
+        and set(previous['parts']) == set(merged_parts) - set(changed)
+        and not removed
+    )
+    if incremental and not changed:
+        print(f"No new or changed parts, {output_file} is up to date")
+        return previous['rows']
+    if incremental:
+        # The previous output comes first, so URLs already known keep their row
+        inputs = [output_file] + [os.path.join(sorted_folder, name) for name in changed]
+        print(f"Merging {len(changed)} new parts into {output_file}")
+    else:
+        inputs = [os.path.join(sorted_folder, name) for name in merged_parts]
+        print(f"Merging {len(inputs)} parts into {output_file}")
+
+    rows = extsort.merge_sorted_files(inputs, header, url_key(header), output_file, unique=True)
+    manifest['output'] = {
+        'file': output_file,
+        'signature': file_signature(output_file),
+        'parts': merged_parts,
+        'rows': rows,
+    }
+    save_manifest(manifest_path, manifest)
+    print(f"Found {rows} unique URLs")
+    print(f"Results saved to {output_file}")
+    return rows
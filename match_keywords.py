@@ -1,42 +1,29 @@
+import heapq
+import itertools
 import json
+import math
 import os
 import pandas as pd
-from rapidfuzz import fuzz
 from dateutil import parser
 
-from dateutil.tz import tzutc
 from tqdm import tqdm
 
 import multiprocessing as mp
 import numpy as np
 
-import re
+from collections import deque
 
+import extsort
+from entity_dictionary import EntityDictionary, parse_epochs, to_epoch
+from match_manifest import MatchManifest
+from match_store import MATCH_FIELDS, MatchStore, article_ids
 
-# Function to check if the date of the article is within the start and end date of a CEO or board member
-def is_within_period(article_date, start_date, end_date):
-    # 如果文章日期为None，返回False（无法确定是否在期间内）
-    if article_date is None:
-        return False
+ENTITY_CACHE_FOLDER = '.entity_cache'
+ENTITY_CACHE_VERSION = 1  # Bump when process_json_data or EntityDictionary change what they produce
+MATCHER_VERSION = 1  # Bump when the matching or the output rows change, every article is matched again
 
-    # Convert all datetimes to aware datetimes in UTC for comparison
-    if article_date and article_date.tzinfo is None:
-        article_date = article_date.replace(tzinfo=tzutc())
-    if start_date and start_date.tzinfo is None:
-        start_date = start_date.replace(tzinfo=tzutc())
-    if end_date and end_date.tzinfo is None:
-        end_date = end_date.replace(tzinfo=tzutc())
-    
-    if start_date and end_date:
-        return start_date <= article_date <= end_date
-    elif start_date:
-        return start_date <= article_date
-    elif end_date:
-        return article_date <= end_date
-    else:
-        return True
 
-# Function to extract time periods from strings
+# Function to extract time periods from strings, as epoch seconds
 def extract_time_periods(names):
     time_periods = {}
     if isinstance(names, str):
@@ -51,13 +38,13 @@ def extract_time_periods(names):
             if 'Start:' in part:
                 start_str = part.replace("Start:", "").replace("T00:00:00Z)", "").strip()
                 try:
-                    start_date = parser.parse(start_str)
+                    start_date = math.floor(to_epoch(parser.parse(start_str)))
                 except (ValueError, parser.ParserError):
                     start_date = None
             elif 'End:' in part:
                 end_str = part.replace("End:", "").replace("T00:00:00Z)", "").strip()
                 try:
-                    end_date = parser.parse(end_str)
+                    end_date = math.floor(to_epoch(parser.parse(end_str)))
                 except (ValueError, parser.ParserError):
                     end_date = None
         
@@ -70,7 +57,6 @@ def process_json_data(json_data):
     for company in json_data:
         if (len(json_data) >= 2 and 'United States' in company['country']) or len(json_data)<=1:
             ticker = company['ticker']
-            print(ticker)
             # Extract time periods for CEOs and board members
             # Add company info to the result
             result[ticker] = {
@@ -83,167 +69,420 @@ def process_json_data(json_data):
                 'ceos': extract_time_periods(company.get('ceos', [])),
                 'board_members': extract_time_periods(company.get('board_members', [])),
             }
-    print(result)
     return result
 
+def load_json_file(file_path):
+    try:
+        # 明确指定UTF-8编码
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except UnicodeDecodeError:
+        # 如果UTF-8失败，尝试其他常见编码
+        print(f"UTF-8解码失败，尝试其他编码读取文件: {os.path.basename(file_path)}")
+        try:
+            with open(file_path, 'r', encoding='gbk') as file:
+                return json.load(file)
+        except UnicodeDecodeError:
+            with open(file_path, 'r', encoding='latin1') as file:
+                return json.load(file)
+
+def entity_dictionary_path(folder_path):
+    return os.path.join(folder_path, ENTITY_CACHE_FOLDER, 'dictionary')
+
+def file_signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
 # Process all JSON files in the 'info' folder
+# The compiled dictionary is cached in {folder}/.entity_cache, keyed by the mtime and size of
+# every JSON file: an unchanged folder loads the memory mapped arrays, and only changed
+# files are parsed again. Files that failed to parse are kept in the manifest too, so they
+# do not make every run rebuild the dictionary; they are retried once they change.
 def read_and_process_json_files(folder_path):
-    all_processed_data = {}    
     print(folder_path)
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.json'):
-            file_path = os.path.join(folder_path, filename)
+    cache_folder = os.path.join(folder_path, ENTITY_CACHE_FOLDER)
+    files_folder = os.path.join(cache_folder, 'files')
+    manifest_path = os.path.join(cache_folder, 'manifest.json')
+    manifest = {'version': ENTITY_CACHE_VERSION, 'files': {}, 'failed': {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != ENTITY_CACHE_VERSION:
+            manifest = {'version': ENTITY_CACHE_VERSION, 'files': {}, 'failed': {}}
+    failed = manifest.get('failed', {})
+    os.makedirs(files_folder, exist_ok=True)
+
+    filenames = [f for f in os.listdir(folder_path) if f.endswith('.json')]
+    signatures = {f: file_signature(os.path.join(folder_path, f)) for f in filenames}
+    if {**manifest['files'], **failed} == signatures and os.path.exists(os.path.join(entity_dictionary_path(folder_path), 'names.json')):
+        return EntityDictionary.load(entity_dictionary_path(folder_path))
+
+    all_processed_data = {}
+    cached_files = {}
+    failed_files = {}
+    for filename in filenames:
+        cache_path = os.path.join(files_folder, filename)
+        if failed.get(filename) == signatures[filename]:
+            # Failed before and unchanged since, parsing it again would fail the same way
+            failed_files[filename] = signatures[filename]
+            continue
+        if manifest['files'].get(filename) == signatures[filename] and os.path.exists(cache_path):
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                processed_data = json.load(f)
+        else:
             try:
-                # 明确指定UTF-8编码
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    json_data = json.load(file)
-                    processed_data = process_json_data(json_data)
-                    all_processed_data.update(processed_data)
-            except UnicodeDecodeError:
-                # 如果UTF-8失败，尝试其他常见编码
-                print(f"UTF-8解码失败，尝试其他编码读取文件: {filename}")
-                try:
-                    with open(file_path, 'r', encoding='gbk') as file:
-                        json_data = json.load(file)
-                        processed_data = process_json_data(json_data)
-                        all_processed_data.update(processed_data)
-                except UnicodeDecodeError:
-                    try:
-                        with open(file_path, 'r', encoding='latin1') as file:
-                            json_data = json.load(file)
-                            processed_data = process_json_data(json_data)
-                            all_processed_data.update(processed_data)
-                    except Exception as e:
-                        print(f"无法读取文件 {filename}: {e}")
+                processed_data = process_json_data(load_json_file(os.path.join(folder_path, filename)))
             except Exception as e:
                 print(f"处理文件 {filename} 时出错: {e}")
-    return all_processed_data
+                failed_files[filename] = signatures[filename]
+                continue
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(processed_data, f, ensure_ascii=False)
+        cached_files[filename] = signatures[filename]
+        all_processed_data.update(processed_data)
+    for filename in set(os.listdir(files_folder)) - set(cached_files):
+        os.remove(os.path.join(files_folder, filename))
+
+    # Compiled into flat arrays: entry ids, ticker ids, attribute codes, epoch periods
+    entity_dictionary = EntityDictionary.from_processed_data(all_processed_data)
+    entity_dictionary.save(entity_dictionary_path(folder_path))
+    manifest['files'] = cached_files
+    manifest['failed'] = failed_files
+    if failed_files:
+        print(f"{len(failed_files)} 个文件无法处理，文件修改后会重试")
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return entity_dictionary
 
 # # Read and process JSON files
 # folder_path = 'crypto'
 # processed_data = read_and_process_json_files(folder_path)
 
-# Append matched articles to the CSV file with all matched strings
-
-def append_to_csv(source_name, ticker, matched_names, article):
-    output_file = f'{source_name}_ticker_matched_articles/{ticker}_match.csv'
-    write_header = not os.path.exists(output_file)
-    article_datetime = parser.parse(article['date_time'])
-    unix_timestamp = int(article_datetime.timestamp())
-    
-    data_to_append = {
-        'time_unix': unix_timestamp,
-        'date_time': article['date_time'],
-        'text_matches': json.dumps(matched_names['text']),
-        'title_matches': json.dumps(matched_names['title']),
-        'title': article['title'],
-        'url': article['url'],
-        'source': article['source'],
-        'source_url': article['source_url'],
-        'article_text': article['article_text'],
-    }
-    df_to_append = pd.DataFrame([data_to_append])
-    df_to_append.to_csv(output_file, mode='a', index=False, header=write_header)
-
-def process_chunk(source_name, chunk, processed_data):
-    for index, row in tqdm(chunk.iterrows(), total=chunk.shape[0], desc="Processing"):
+MATCH_BUFFER_ROWS = 20000  # Matched rows held in memory before they are spilled to sorted run files
+RUN_FIELDS = ['ticker'] + MATCH_FIELDS  # Run files hold every ticker's rows, sorted by ticker then time
+
+# One output row per ticker matched in the article, with all matched strings
+def match_rows(ticker_matches, article, time_unix):
+    rows = []
+    for ticker, matched_names in ticker_matches.items():
+        rows.append((ticker, {
+            'time_unix': time_unix,
+            'date_time': article['date_time'],
+            'text_matches': json.dumps(matched_names['text']),
+            'title_matches': json.dumps(matched_names['title']),
+            'title': article['title'],
+            'url': article['url'],
+            'source': article['source'],
+            'source_url': article['source_url'],
+            'article_text': article['article_text'],
+        }))
+    return rows
+
+def csv_value(value):
+    # Written like pandas.to_csv does: missing values as empty fields
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ''
+    return value
+
+def run_key(row):
+    return row[0], float(row[1])
+
+def time_key(row):
+    return float(row[0])
+
+def read_match_rows(path):
+    # Rows of an existing match file in MATCH_FIELDS order; older files have time_unix last
+    rows = extsort.read_csv_rows(path)
+    header = next(rows, [])
+    order = [header.index(f) if f in header else None for f in MATCH_FIELDS]
+    return ([row[i] if i is not None else '' for i in order] for row in rows)
+
+class MatchWriter:
+    """Writes the matched rows into {ticker}_match.csv files, sorted by time_unix.
+
+    Runs in the main process only, so no two processes append to the same file.
+    Rows are buffered per ticker; once max_rows are buffered, they are sorted
+    by ticker and time and spilled to one run file. close() merges the runs,
+    at most extsort.MERGE_FAN_IN files at a time, and streams each ticker's
+    rows, with the rows its file already had, into the final sorted file.
+    """
+
+    def __init__(self, output_folder, max_rows=MATCH_BUFFER_ROWS):
+        self.output_folder = output_folder
+        self.run_folder = os.path.join(output_folder, '.runs')
+        self.max_rows = max_rows
+        self.buffers = {}
+        self.buffered = 0
+        self.runs = []
+        self.tickers = set()
+        # Runs left behind by an interrupted run are incomplete, drop them
+        if os.path.exists(self.run_folder):
+            for filename in os.listdir(self.run_folder):
+                os.remove(os.path.join(self.run_folder, filename))
+        os.makedirs(self.run_folder, exist_ok=True)
+
+    def add(self, ticker, row):
+        self.buffers.setdefault(ticker, []).append(row)
+        self.buffered += 1
+        if self.buffered >= self.max_rows:
+            self.spill()
+
+    def spill(self):
+        if not self.buffers:
+            return
+        for rows in self.buffers.values():
+            rows.sort(key=lambda row: row['time_unix'])
+        path = os.path.join(self.run_folder, f'run_{len(self.runs)}.csv')
+        extsort.write_csv_rows(path, RUN_FIELDS, (
+            [ticker] + [csv_value(row[f]) for f in MATCH_FIELDS]
+            for ticker in sorted(self.buffers) for row in self.buffers[ticker]
+        ))
+        self.runs.append(path)
+        self.tickers.update(self.buffers)
+        self.buffers = {}
+        self.buffered = 0
+
+    def remove_tickers(self, tickers):
+        # Files of tickers that are matched again from scratch, called before any add
+        for ticker in tickers:
+            output_file = os.path.join(self.output_folder, f'{ticker}_match.csv')
+            if os.path.exists(output_file):
+                os.remove(output_file)
+
+    def presort_existing(self, sorted_manifest):
+        # Files from an earlier run are merged with the new rows, so they must be sorted
+        # first. Nothing is written if one cannot be: the caller's manifest is not saved
+        # and the next run matches these articles again.
+        failed = []
+        for ticker in sorted(self.tickers):
+            filename = f'{ticker}_match.csv'
+            output_file = os.path.join(self.output_folder, filename)
+            if not os.path.exists(output_file) or sorted_manifest.get(filename) == file_signature(output_file):
+                continue
+            if sort_matched_csv(output_file):
+                sorted_manifest[filename] = file_signature(output_file)
+            else:
+                failed.append(filename)
+        save_sorted_manifest(self.output_folder, sorted_manifest)
+        if failed:
+            raise RuntimeError(f"Could not sort {len(failed)} existing match files ({', '.join(failed[:5])}), "
+                               f"fix or remove them and run again")
+
+    def close(self):
+        self.spill()
+        sorted_manifest = load_sorted_manifest(self.output_folder)
+        self.presort_existing(sorted_manifest)
+        runs = extsort.reduce_runs(self.runs, RUN_FIELDS, run_key, self.run_folder)
+        merged = heapq.merge(*(extsort.iter_sorted_file(p) for p in runs), key=run_key)
+        grouped = itertools.groupby(merged, key=lambda row: row[0])
+        for ticker, rows in tqdm(grouped, total=len(self.tickers), desc="Writing"):
+            filename = f'{ticker}_match.csv'
+            output_file = os.path.join(self.output_folder, filename)
+            rows = (row[1:] for row in rows)
+            if os.path.exists(output_file):
+                # Rows from an earlier run come first among equal times
+                rows = heapq.merge(read_match_rows(output_file), rows, key=time_key)
+            extsort.write_csv_rows(output_file + '.tmp', MATCH_FIELDS, rows)
+            os.replace(output_file + '.tmp', output_file)
+            sorted_manifest[filename] = file_signature(output_file)
+        save_sorted_manifest(self.output_folder, sorted_manifest)
+        for path in runs:
+            os.remove(path)
+        os.rmdir(self.run_folder)
+
+def process_chunk(chunk, entity_dictionary, show_progress=True, entry_mask=None):
+    """Returns (ticker, row) for every ticker matched by an article of chunk.
+
+    With entry_mask only those dictionary entries are matched.
+    """
+    matches = []
+    # Dates are parsed once for the whole chunk, the epoch is used for the periods and as time_unix
+    floor, ceil, dated = parse_epochs(chunk['date_time'])
+    rows = enumerate(chunk.iterrows())
+    if show_progress:
+        rows = tqdm(rows, total=chunk.shape[0], desc="Processing")
+    for i, (index, row) in rows:
         article_text = str(row['article_text']) if row['article_text'] else ""
         title = str(row['title']) if row['title'] else ""
-        article_date = parser.parse(str(row['date_time'])) if pd.notna(row['date_time']) else None
-        ticker_matches = {}  # Dictionary to hold all matches for this article
-
-        def find_positions(pattern, text):
-            return [match.start() for match in re.finditer(pattern, text)]
-
-        # Check each ticker's data for matches
-        for ticker, value in processed_data.items():
-            text_matches = {}
-            title_matches = {}
-            for attribute, names in value.items():
-                for name, (start_date, end_date) in names.items():
-                    if is_within_period(article_date, start_date, end_date):
-                        if name.isupper():
-                            if len(name) > 1:
-                                pattern = r'\b' + re.escape(name) + r'\b'
-                                text_positions = find_positions(pattern, article_text)
-                                title_positions = find_positions(pattern, title)
-                                if text_positions:
-                                    text_matches[name] = text_positions
-                                if title_positions:
-                                    title_matches[name] = title_positions
-                        elif not (name.islower() and name.replace(' ', '').isalpha()):
-                            text_match = fuzz.partial_ratio(article_text, name) > 95
-                            title_match = fuzz.partial_ratio(title, name) > 95
-                            if text_match:
-                                text_matches[name] = find_positions(name, article_text)
-                            if title_match:
-                                title_matches[name] = find_positions(name, title)
-
-            # If there were any matches for this ticker, add them to the article_matches
-            if text_matches or title_matches:                
-                ticker_matches[ticker] = {
-                    'text': text_matches,
-                    'title': title_matches
-                }
-
-        # Now write each set of matches to its respective CSV
-        for ticker, matched_names in ticker_matches.items():
-            # print(matched_names)
-            append_to_csv(source_name, ticker, matched_names, row)
+        article_epoch = (int(floor[i]), int(ceil[i])) if dated[i] else None
+
+        # Dictionary to hold all matches for this article
+        ticker_matches = entity_dictionary.match(article_text, title, article_epoch, entry_mask)
+        if ticker_matches:
+            matches.extend(match_rows(ticker_matches, row, int(floor[i])))
+    return matches
+
+
+# Pool workers load the compiled dictionary once, memory mapped from the cache,
+# so only article rows are sent with each task
+worker_entity_dictionary = None
+worker_rematch_mask = None
+
+def init_worker(dictionary_path, rematch_tickers=()):
+    global worker_entity_dictionary, worker_rematch_mask
+    worker_entity_dictionary = EntityDictionary.load(dictionary_path)
+    worker_rematch_mask = worker_entity_dictionary.ticker_mask(rematch_tickers)
+
+def match_chunk(chunk, rematch_only=False):
+    # Articles matched in an earlier run are only matched against the changed tickers
+    # The rows of one article share its strings, so they are pickled back once
+    entry_mask = worker_rematch_mask if rematch_only else None
+    return process_chunk(chunk, worker_entity_dictionary, show_progress=False, entry_mask=entry_mask)
+
+
+SORT_RUN_ROWS = 10000  # Rows (with their article text) each sorting process holds in memory
+SORTED_MANIFEST = '.sorted_manifest.json'
+
+# {filename: mtime:size} of the match files known to be sorted by time_unix
+def load_sorted_manifest(folder):
+    path = os.path.join(folder, SORTED_MANIFEST)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_sorted_manifest(folder, manifest):
+    path = os.path.join(folder, SORTED_MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def add_time_unix(file_path):
+    # Older match files have no time_unix column, append it computed from date_time
+    rows = extsort.read_csv_rows(file_path)
+    header = next(rows)
+    date_index = header.index('date_time')
+
+    def with_time_unix():
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= SORT_RUN_ROWS:
+                yield from time_unix_batch(batch)
+                batch = []
+        yield from time_unix_batch(batch)
+
+    def time_unix_batch(batch):
+        floor, _, dated = parse_epochs([row[date_index] for row in batch])
+        if not dated.all():
+            raise ValueError(f"unparseable date_time {batch[int(np.argmin(dated))][date_index]!r}")
+        return [row + [int(t)] for row, t in zip(batch, floor)]
 
+    try:
+        extsort.write_csv_rows(file_path + '.tmp', header + ['time_unix'], with_time_unix())
+    except Exception:
+        os.remove(file_path + '.tmp')
+        raise
+    os.replace(file_path + '.tmp', file_path)
 
 def sort_matched_csv(file_path):
+    """External sort of one match file on time_unix, in bounded memory. Returns True when sorted."""
     try:
-        df = pd.read_csv(file_path)
-        
-        # Custom parsing function for the datetime
-        def parse_datetime(date_string):
-            return parser.parse(date_string)
-
-        # Apply the custom parsing function and create Unix timestamp if not present
-        if 'time_unix' not in df.columns:
-            df['date_time'] = df['date_time'].apply(parse_datetime)
-            df['time_unix'] = df['date_time'].apply(lambda x: int(x.timestamp()))
-
-        # Sort by Unix timestamp
-        df_sorted = df.sort_values('time_unix', ascending=True)
-        
-        # Ensure 'time_unix' is an integer
-        df_sorted['time_unix'] = df_sorted['time_unix'].astype(int)
-        
-        df_sorted.to_csv(file_path, index=False)
+        header = next(extsort.read_csv_rows(file_path), None)
+        if header is None:
+            return True
+        if 'time_unix' not in header:
+            add_time_unix(file_path)
+        # Sorted runs of SORT_RUN_ROWS rows are spilled next to the file and k-way merged
+        extsort.sort_csv_file(file_path, file_path, 'time_unix', float, run_rows=SORT_RUN_ROWS)
         print(f"Sorted and saved: {file_path}")
+        return True
     except Exception as e:
         print(f"Error processing {file_path}: {str(e)}")
+        return False
+
+def sort_matched_file(args):
+    folder, filename = args
+    return filename, sort_matched_csv(os.path.join(folder, filename))
+
+def sort_matched_folder(folder, processes=None):
+    """Sorts every match file of folder that is not already sorted, one file per process."""
+    manifest = load_sorted_manifest(folder)
+    filenames = sorted(f for f in os.listdir(folder) if f.endswith('.csv'))
+    manifest = {f: sig for f, sig in manifest.items() if f in filenames}
+    todo = [f for f in filenames if manifest.get(f) != file_signature(os.path.join(folder, f))]
+    failed = 0
+    if todo:
+        with mp.Pool(processes=min(processes or mp.cpu_count(), len(todo))) as pool:
+            for filename, ok in pool.imap_unordered(sort_matched_file, [(folder, f) for f in todo]):
+                if ok:
+                    manifest[filename] = file_signature(os.path.join(folder, filename))
+                else:
+                    failed += 1
+    save_sorted_manifest(folder, manifest)
+    print(f"{len(filenames) - len(todo)} files already sorted, {len(todo) - failed} sorted now, {failed} failed")
 
 
 if __name__ == '__main__':
     # 读取并处理 JSON 文件
     source_name = 'yahoo'
     folder_path = 'info/Icahn_filter'
-    processed_data = read_and_process_json_files(folder_path)
+    entity_dictionary = read_and_process_json_files(folder_path)
 
     # 分块读取 CSV（防止内存爆）
     chunksize = 20000  # 每次处理 5 万行
-    os.makedirs(f'{source_name}_ticker_matched_articles', exist_ok=True)
-
-    for chunk in pd.read_csv('datasets/yahoo_articles_all_20250605.csv', chunksize=chunksize):
-        num_processes = mp.cpu_count()
-        sub_chunks = np.array_split(chunk, num_processes)
-
-        with mp.Pool(processes=num_processes) as pool:
-            list(tqdm(
-                pool.starmap(process_chunk, [(source_name, sub_chunk, processed_data) for sub_chunk in sub_chunks]),
-                total=len(sub_chunks)
-            ))
-
-    print("All matched CSV files have been processed.")
-
-    # 按时间排序每个结果文件
-    for file in os.listdir(f"{source_name}_ticker_matched_articles"):
-        sort_matched_csv(f"{source_name}_ticker_matched_articles/{file}")
-
-    print("All matched CSV files have been sorted by date and time.")
+    task_rows = 500    # Rows per pool task
+    # 'csv': one {ticker}_match.csv per ticker, each holding the full text of its articles
+    # 'sqlite': {source_name}_matches.db, every article stored once plus a hit index by
+    # ticker and time; MatchStore.ticker_matches(ticker) gives the same rows as the CSV
+    output_mode = 'csv'
+    if output_mode == 'sqlite':
+        writer = MatchStore(f'{source_name}_matches.db')
+        manifest_folder = f'{source_name}_matches.manifest'
+    else:
+        os.makedirs(f'{source_name}_ticker_matched_articles', exist_ok=True)
+        writer = MatchWriter(f'{source_name}_ticker_matched_articles')
+        manifest_folder = os.path.join(f'{source_name}_ticker_matched_articles', '.manifest')
+
+    # Only articles not in the manifest are matched, against every ticker. Tickers whose
+    # dictionary entries changed are cleared and matched again over the older articles too
+    manifest = MatchManifest(manifest_folder, MATCHER_VERSION)
+    signatures = entity_dictionary.ticker_signatures()
+    rematch_tickers, removed_tickers = manifest.changed_tickers(signatures)
+    writer.remove_tickers(rematch_tickers | removed_tickers)
+    print(f"{len(rematch_tickers)} tickers to match again, {len(removed_tickers)} removed")
+
+    # One pool for the whole run; at most max_pending tasks are queued, so the
+    # next chunk is read while the workers match the current one
+    num_processes = mp.cpu_count()
+    max_pending = 2 * num_processes
+    pending = deque()
+    with mp.Pool(processes=num_processes, initializer=init_worker,
+                 initargs=(entity_dictionary_path(folder_path), sorted(rematch_tickers))) as pool, tqdm(desc="Articles") as progress:
+        for chunk in pd.read_csv('datasets/yahoo_articles_all_20250605.csv', chunksize=chunksize):
+            ids = np.array(article_ids(chunk['url']), dtype=np.int64)
+            processed = manifest.is_processed(ids)
+            manifest.add(ids[~processed])
+            for start in range(0, len(chunk), task_rows):
+                sub_chunk = chunk.iloc[start:start + task_rows]
+                sub_processed = processed[start:start + task_rows]
+                tasks = [(sub_chunk[~sub_processed], False)]
+                if rematch_tickers:
+                    tasks.append((sub_chunk[sub_processed], True))
+                else:
+                    progress.update(int(sub_processed.sum()))
+                for rows, rematch_only in tasks:
+                    if len(rows):
+                        pending.append((pool.apply_async(match_chunk, (rows, rematch_only)), len(rows)))
+                while len(pending) >= max_pending:
+                    result, rows = pending.popleft()
+                    for ticker, row in result.get():
+                        writer.add(ticker, row)
+                    progress.update(rows)
+        while pending:
+            result, rows = pending.popleft()
+            for ticker, row in result.get():
+                writer.add(ticker, row)
+            progress.update(rows)
+
+    # Every file (or the hit index) is written sorted by time; files left by older
+    # runs that are not in the sorted manifest yet are sorted in parallel
+    writer.close()
+    manifest.save(signatures)
+    if output_mode == 'csv':
+        sort_matched_folder(f'{source_name}_ticker_matched_articles')
+    print("All matched CSV files have been processed and sorted by date and time.")
 
 
 
@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+
+ARTICLE_IDS_FILE = 'article_ids.npy'
+STATE_FILE = 'state.json'
+
+
+class MatchManifest:
+    """What a match output already holds, so a run only matches what is missing.
+
+    article_ids.npy is the sorted set of article ids (URL hashes) that have been
+    matched into the output. state.json holds the matcher version and the
+    dictionary signature of every ticker the output was matched with. A new
+    matcher version keeps the tickers but drops their signatures and the
+    articles, so everything is matched again.
+    """
+
+    def __init__(self, folder, matcher_version):
+        self.folder = folder
+        self.matcher_version = matcher_version
+        self.tickers = {}
+        self.article_ids = np.zeros(0, dtype=np.int64)
+        self.new_ids = []
+        state_path = os.path.join(folder, STATE_FILE)
+        if not os.path.exists(state_path):
+            return
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+        if state.get('matcher_version') != matcher_version:
+            self.tickers = dict.fromkeys(state.get('tickers', {}))
+            return
+        self.tickers = state['tickers']
+        self.article_ids = np.load(os.path.join(folder, ARTICLE_IDS_FILE))
+
+    def changed_tickers(self, signatures):
+        """(tickers to match again, tickers no longer in the dictionary) for {ticker: signature}."""
+        rematch = set(t for t, signature in signatures.items() if self.tickers.get(t) != signature)
+        removed = set(self.tickers) - set(signatures)
+        return rematch, removed
+
+    def is_processed(self, ids):
+        """Boolean array over ids, True for the articles already matched in an earlier run."""
+        ids = np.asarray(ids, dtype=np.int64)
+        positions = np.searchsorted(self.article_ids, ids)
+        found = positions < len(self.article_ids)
+        found[found] = self.article_ids[positions[found]] == ids[found]
+        return found
+
+    def add(self, ids):
+        self.new_ids.append(np.asarray(ids, dtype=np.int64))
+
+    def save(self, signatures):
+        # Written after the output is complete; an interrupted run is redone from the last saved state
+        os.makedirs(self.folder, exist_ok=True)
+        self.article_ids = np.unique(np.concatenate([self.article_ids] + self.new_ids))
+        self.new_ids = []
+        self.tickers = dict(signatures)
+        ids_path = os.path.join(self.folder, ARTICLE_IDS_FILE)
+        with open(ids_path + '.tmp', 'wb') as f:
+            np.save(f, self.article_ids)
+        os.replace(ids_path + '.tmp', ids_path)
+        state_path = os.path.join(self.folder, STATE_FILE)
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump({'matcher_version': self.matcher_version, 'tickers': self.tickers}, f, indent=0, sort_keys=True)
+        os.replace(state_path + '.tmp', state_path)
@@ -0,0 +1,135 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import url_canon
+
+# Columns of a {ticker}_match.csv file, the per-ticker views are built with the same columns
+MATCH_FIELDS = ['time_unix', 'date_time', 'text_matches', 'title_matches', 'title', 'url', 'source', 'source_url', 'article_text']
+ARTICLE_FIELDS = ['url', 'date_time', 'title', 'source', 'source_url', 'article_text']
+STORE_BATCH_ROWS = 5000  # Hits written per executemany / commit
+
+
+def article_ids(urls):
+    # 64-bit fingerprints of the canonical URLs as signed SQLite integers
+    canonical = url_canon.canonicalize(urls)
+    keys = canonical.where(canonical.notna(), pd.Series(urls, dtype=object).astype(str))
+    return url_canon.fingerprint(keys).astype(np.int64).tolist()
+
+
+class MatchStore:
+    """Normalized match output: every article stored once, plus a compact hit index.
+
+    articles holds each matched article keyed by the hash of its URL. hits holds
+    (ticker, time, article, matched strings), a WITHOUT ROWID table clustered on
+    ticker then time, so one ticker's matches in time order are a single range
+    scan. ticker_matches() rebuilds the rows of a {ticker}_match.csv on demand.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tickers (
+                ticker_id INTEGER PRIMARY KEY,
+                ticker TEXT UNIQUE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS articles (
+                article_id INTEGER PRIMARY KEY,
+                url TEXT,
+                date_time TEXT,
+                title TEXT,
+                source TEXT,
+                source_url TEXT,
+                article_text TEXT
+            );
+            CREATE TABLE IF NOT EXISTS hits (
+                ticker_id INTEGER NOT NULL,
+                time_unix INTEGER NOT NULL,
+                article_id INTEGER NOT NULL,
+                text_matches TEXT,
+                title_matches TEXT,
+                PRIMARY KEY (ticker_id, time_unix, article_id)
+            ) WITHOUT ROWID;
+        """)
+        self.ticker_ids = dict((t, i) for i, t in self.conn.execute("SELECT ticker_id, ticker FROM tickers"))
+        self.articles = []
+        self.hits = []
+        self.last_url = None
+
+    def ticker_id(self, ticker):
+        if ticker not in self.ticker_ids:
+            cursor = self.conn.execute("INSERT INTO tickers (ticker) VALUES (?)", (ticker,))
+            self.ticker_ids[ticker] = cursor.lastrowid
+        return self.ticker_ids[ticker]
+
+    def add(self, ticker, row):
+        """Stores one row of the match output (the MATCH_FIELDS of a {ticker}_match.csv row)."""
+        # The rows of one article arrive together, its text is stored with the first of them
+        if row['url'] != self.last_url:
+            self.last_url = row['url']
+            self.articles.append(tuple(none_if_missing(row[f]) for f in ARTICLE_FIELDS))
+        self.hits.append((self.ticker_id(ticker), int(row['time_unix']), len(self.articles) - 1,
+                          row['text_matches'], row['title_matches']))
+        if len(self.hits) >= STORE_BATCH_ROWS:
+            self.flush()
+
+    def flush(self):
+        # Article ids are hashed for the whole batch at once
+        ids = article_ids([article[0] for article in self.articles])
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  [(i, *article) for i, article in zip(ids, self.articles)])
+            # Running a chunk again replaces its hits instead of duplicating them
+            self.conn.executemany("INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?, ?)",
+                                  [(t, time_unix, ids[a], text, title) for t, time_unix, a, text, title in self.hits])
+        self.articles = []
+        self.hits = []
+        self.last_url = None
+
+    def remove_tickers(self, tickers):
+        # Hits of tickers that are matched again from scratch; their articles stay, other tickers share them
+        ids = [(self.ticker_ids[t],) for t in tickers if t in self.ticker_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM hits WHERE ticker_id = ?", ids)
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    # Reader API
+
+    def tickers(self):
+        return [t for (t,) in self.conn.execute("SELECT ticker FROM tickers ORDER BY ticker")]
+
+    def ticker_matches(self, ticker, start=None, end=None):
+        """DataFrame of one ticker's matches sorted by time, with the columns of {ticker}_match.csv.
+
+        start / end (unix seconds, inclusive) limit the range that is read.
+        """
+        query = """
+            SELECT h.time_unix, a.date_time, h.text_matches, h.title_matches, a.title,
+                   a.url, a.source, a.source_url, a.article_text
+            FROM hits h JOIN articles a ON a.article_id = h.article_id
+            WHERE h.ticker_id = ? AND h.time_unix BETWEEN ? AND ?
+            ORDER BY h.time_unix, h.article_id
+        """
+        ticker_id = self.ticker_ids.get(ticker)
+        if ticker_id is None:
+            return pd.DataFrame(columns=MATCH_FIELDS)
+        bounds = (np.iinfo(np.int64).min if start is None else start, np.iinfo(np.int64).max if end is None else end)
+        rows = self.conn.execute(query, (ticker_id, *map(int, bounds))).fetchall()
+        return pd.DataFrame(rows, columns=MATCH_FIELDS)
+
+    def export_csv(self, ticker, output_file):
+        self.ticker_matches(ticker).to_csv(output_file, index=False)
+
+
+def none_if_missing(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
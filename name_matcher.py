@@ -0,0 +1,206 @@
+import re
+from collections import Counter, deque
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over a list of literal patterns.
+
+    iter_matches walks a text once and yields every occurrence of every
+    pattern, overlapping ones included, in order of their end position.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.lengths = [len(p) for p in self.patterns]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][ch] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern_id)
+
+        # Breadth first, so the failure state of a parent is known before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                # Patterns ending at the failure state end here too
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+        # No pattern spans a character outside this set, the text is only walked inside runs of it
+        alphabet = sorted({ch for p in self.patterns for ch in p})
+        self.runs = re.compile('[' + ''.join(re.escape(ch) for ch in alphabet) + ']+') if alphabet else None
+
+    def iter_matches(self, text):
+        """Yields (pattern_id, start, end) for every occurrence in text."""
+        if self.runs is None:
+            return
+        goto, fail, output, lengths = self.goto, self.fail, self.output, self.lengths
+        for run in self.runs.finditer(text):
+            state = 0
+            for end, ch in enumerate(run.group(), run.start() + 1):
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                for pattern_id in output[state]:
+                    yield pattern_id, end - lengths[pattern_id], end
+
+
+def is_word_char(ch):
+    # Same as \w in a str pattern
+    return ch.isalnum() or ch == '_'
+
+
+def is_word_boundary(text, i):
+    # Same as \b: a word character on exactly one side of position i
+    before = i > 0 and is_word_char(text[i - 1])
+    after = i < len(text) and is_word_char(text[i])
+    return before != after
+
+
+def group_entries(entries):
+    # Unique names in first seen order, and the entry indices of each
+    ids = {}
+    entries_of = []
+    for index, (name, _) in enumerate(entries):
+        if name not in ids:
+            ids[name] = len(ids)
+            entries_of.append([])
+        entries_of[ids[name]].append(index)
+    return list(ids), entries_of
+
+
+class WordMatcher:
+    """Finds every name of a large list as a whole word in one pass over a text.
+
+    For each name the positions are exactly those of
+    re.finditer(r'\\b' + re.escape(name) + r'\\b', text): word boundaries on
+    both ends, and non-overlapping occurrences, leftmost first.
+    entries is a list of (name, payload); a name may appear in several entries.
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.names, self.entries_of = group_entries(self.entries)
+        self.automaton = AhoCorasick(self.names)
+
+    def _positions_by_id(self, text):
+        found = {}
+        last_end = {}
+        for name_id, start, end in self.automaton.iter_matches(text):
+            # Matches of one name come in order of their start, so skipping
+            # those overlapping the previous one gives what finditer returns
+            if start < last_end.get(name_id, 0):
+                continue
+            if is_word_boundary(text, start) and is_word_boundary(text, end):
+                found.setdefault(name_id, []).append(start)
+                last_end[name_id] = end
+        return found
+
+    def positions(self, text):
+        """Returns {name: [start, ...]} for every name found in text."""
+        return {self.names[name_id]: starts for name_id, starts in self._positions_by_id(text).items()}
+
+    def find(self, text):
+        """Returns [(payload, name, positions)] of every entry whose name is found, in entry order."""
+        hits = []
+        for name_id, starts in self._positions_by_id(text).items():
+            for index in self.entries_of[name_id]:
+                hits.append((index, self.entries[index][1], self.names[name_id], starts))
+        hits.sort(key=lambda hit: hit[0])
+        return [hit[1:] for hit in hits]
+
+
+class FuzzyMatcher:
+    """Finds the names with fuzz.partial_ratio(text, name) > threshold, without scoring every name.
+
+    A name of length L can only score above the threshold against some
+    window of the text if at most d = floor(2 * (100 - threshold) * L / 100)
+    insertions or deletions turn it into that window, and each of those
+    destroys at most q of its q-grams. So at least L - q + 1 - q * d of the
+    name's q-grams occur in the text. An inverted q-gram index counts these
+    for all names at once, only the names reaching the bound are scored, in
+    one process.cdist call. The results are the same as scoring every name.
+    A text shorter than a name swaps the roles in partial_ratio, such names
+    are always scored.
+    """
+
+    def __init__(self, entries, threshold=95, q=3):
+        self.entries = list(entries)
+        self.threshold = threshold
+        self.q = q
+        self.names, self.entries_of = group_entries(self.entries)
+        self.entry_name = np.zeros(len(self.entries), dtype=np.int64)
+        for name_id, indices in enumerate(self.entries_of):
+            self.entry_name[indices] = name_id
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int64)
+        max_edits = (2 * (100 - threshold) * self.lengths) // 100
+        self.min_shared = self.lengths - q + 1 - q * max_edits
+
+        grams = {}
+        posting_gram = []
+        posting_name = []
+        posting_count = []
+        for name_id, name in enumerate(self.names):
+            for gram, count in Counter(name[i:i + q] for i in range(len(name) - q + 1)).items():
+                posting_gram.append(grams.setdefault(gram, len(grams)))
+                posting_name.append(name_id)
+                posting_count.append(count)
+        self.grams = grams
+        self.posting_gram = np.array(posting_gram, dtype=np.int64)
+        self.posting_name = np.array(posting_name, dtype=np.int64)
+        self.posting_count = np.array(posting_count, dtype=np.int64)
+
+    def candidates(self, text, name_mask=None):
+        """Ids of the names that may score above the threshold against text."""
+        q = self.q
+        present = np.zeros(len(self.grams), dtype=bool)
+        gram_ids = [self.grams.get(text[i:i + q]) for i in range(len(text) - q + 1)]
+        present[[g for g in set(gram_ids) if g is not None]] = True
+        mask = present[self.posting_gram]
+        shared = np.bincount(self.posting_name[mask], weights=self.posting_count[mask], minlength=len(self.names))
+        possible = (shared >= self.min_shared) | (self.lengths > len(text))
+        if name_mask is not None:
+            possible &= name_mask
+        return np.flatnonzero(possible)
+
+    def _matching_ids(self, text, name_mask=None):
+        ids = self.candidates(text, name_mask)
+        if not len(ids):
+            return []
+        scores = process.cdist([text], [self.names[i] for i in ids], scorer=fuzz.partial_ratio)[0]
+        return ids[scores > self.threshold]
+
+    def find(self, text, entry_mask=None):
+        """Returns [(payload, name)] of every entry whose name matches, in entry order.
+
+        With entry_mask (a boolean array over the entries) only those entries are
+        reported, and names none of them uses are not scored at all.
+        """
+        name_mask = None
+        if entry_mask is not None:
+            name_mask = np.bincount(self.entry_name[entry_mask], minlength=len(self.names)) > 0
+        hits = []
+        for name_id in self._matching_ids(text, name_mask):
+            for index in self.entries_of[name_id]:
+                if entry_mask is None or entry_mask[index]:
+                    hits.append((index, self.entries[index][1], self.names[name_id]))
+        hits.sort(key=lambda hit: hit[0])
+        return [hit[1:] for hit in hits]
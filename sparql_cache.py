@@ -0,0 +1,80 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_PATH = '.sparql_cache.db'
+CACHE_TTL = 7 * 24 * 3600  # Seconds a response is served from the cache
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used responses are evicted above this size
+
+
+def normalize_query(query):
+    # Indentation and line breaks do not change a query, so they do not change its key
+    return ' '.join(query.split())
+
+
+def query_key(query):
+    return hashlib.sha256(normalize_query(query).encode('utf-8')).hexdigest()
+
+
+class SparqlCache:
+    """On-disk cache of SPARQL JSON responses, keyed by the hash of the normalized query.
+
+    Entries older than ttl seconds are treated as missing and fetched again.
+    Bodies are stored zlib-compressed; once they add up to more than max_bytes
+    the least recently used ones are deleted. Safe to share between threads.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                size INTEGER NOT NULL,
+                body BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+
+    def get(self, query):
+        """The cached response of query, None if it is missing or expired."""
+        key = query_key(query)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT created, body FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[0] > self.ttl:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(zlib.decompress(row[1]).decode('utf-8'))
+
+    def put(self, query, data):
+        body = zlib.compress(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                              (query_key(query), now, now, len(body), body))
+            self.evict()
+
+    def evict(self):
+        # Expired entries first, then the least recently used until the cache fits
+        self.conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def close(self):
+        self.conn.close()
@@ -5,6 +5,31 @@ import requests
 import pandas as pd
 import json
 
+from sparql_cache import SparqlCache
+
+cache = None
+
+
+def get_cache():
+    # Opened on first use, so importing this module does not create .sparql_cache.db
+    global cache
+    if cache is None:
+        cache = SparqlCache()
+    return cache
+
+
+def get_json(endpoint_url, query):
+    # Responses are cached by query, only missing or expired ones are requested
+    cache = get_cache()
+    data = cache.get(query)
+    if data is None:
+        response = requests.get(endpoint_url, params={'query': query, 'format': 'json'})
+        if not response.ok:
+            return None
+        data = response.json()
+        cache.put(query, data)
+    return data
+
 
 
 def query_wikidata(symbol):
@@ -155,25 +180,25 @@ def query_wikidata(symbol):
     all_results = []
 
     # Send the requests and process the responses
-    response_1 = requests.get(endpoint_url, params={'query': query_1, 'format': 'json'})
-    response_2 = requests.get(endpoint_url, params={'query': query_2, 'format': 'json'})
-    response_3 = requests.get(endpoint_url, params={'query': query_3, 'format': 'json'})
-
-    if response_1.ok and response_2.ok and response_3.ok:
-        # Process the first query results
-        data_1 = response_1.json()
-        data_2 = response_2.json()
-        data_3 = response_3.json()
+    data_1 = get_json(endpoint_url, query_1)
+    data_2 = get_json(endpoint_url, query_2)
+    data_3 = get_json(endpoint_url, query_3)
+
+    if data_1 is not None and data_2 is not None and data_3 is not None:
         
-        # Assuming both queries return the same number of rows for each company
-        for i in range(len(data_1['results']['bindings'])):
-            result_1 = data_1['results']['bindings'][i]
-            result_2 = data_2['results']['bindings'][i]
-            result_3 = data_3['results']['bindings'][i]
-            
+        # The rows of the three queries are joined on (ticker, entity id), their order differs
+        # between queries for companies listed on several exchanges
+        joined = {}
+        for index, data in enumerate((data_1, data_2, data_3)):
+            for result in data['results']['bindings']:
+                key = (result['ticker']['value'], result['id']['value'])
+                joined.setdefault(key, [{}, {}, {}])[index] = result
+
+        for (ticker, entity), (result_1, result_2, result_3) in joined.items():
             entry = {
-                'id_label': result_1['idLabels']['value'],
-                'ticker': result_1['ticker']['value'],
+                'id': entity.rsplit('/', 1)[-1],
+                'id_label': result_1['idLabels']['value'] if 'idLabels' in result_1 else '',
+                'ticker': ticker,
                 'country': result_1['countries']['value'].split('| | |') if 'countries' in result_1 else [],
                 'industry': result_1['industries']['value'].split('| | |') if 'industries' in result_1 else [],
                 'aliases': result_1['aliases']['value'].split('| | |') if 'aliases' in result_1 else [],
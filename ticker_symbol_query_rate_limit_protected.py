@@ -4,19 +4,51 @@ import json
 import os
 import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from email.utils import parsedate_to_datetime
 from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
 from urllib3.util.retry import Retry
 
+from sparql_cache import SparqlCache
 
-def create_session():
-    """创建一个带有重试策略的会话"""
+ENDPOINT_URL = "https://query.wikidata.org/sparql"
+INFO_FOLDER = os.path.join('info', 'Icahn')  # {symbol}_info.json 的保存和检查目录
+
+# 批量查询: 一个查询带 BATCH_SIZE 个股票代码，端点超时时减半
+use_batched_queries = True
+BATCH_SIZE = 40
+
+# 并发模式: MAX_WORKERS 个批次同时查询，每个批次的三个查询并行，
+# 所有线程共用一个限速器，遇到 429/503 时按 Retry-After 一起暂停
+use_concurrent_fetch = True
+MAX_WORKERS = 2
+REQUESTS_PER_SECOND = 1.0
+RATE_LIMIT_WAIT = 60  # 没有 Retry-After 时暂停的秒数
+MAX_REQUEST_INTERVAL = 30
+QUERY_TIMEOUT = (15, 60)  # (连接, 读取) 秒，读取超时说明批次太大
+
+# 查询结果缓存在 .sparql_cache.db，按规范化的查询文本的哈希查找，过期 (CACHE_TTL) 后重新查询
+use_response_cache = True
+response_cache = None
+response_cache_lock = threading.Lock()
+
+
+def create_session(status_forcelist=(429, 500, 502, 503, 504), read_retries=None, retries=5):
+    """创建一个带有重试策略的会话
+
+    read_retries=False 时读取超时不在会话里重试，直接抛出 ReadTimeout；
+    retries=0 时会话不重试，全部交给调用者
+    """
     session = requests.Session()
 
     # 设置重试策略
     retry_strategy = Retry(
-        total=5,  # 增加重试次数
+        total=retries,  # 增加重试次数
+        read=read_retries,
         backoff_factor=2,  # 增加退避因子
-        status_forcelist=[429, 500, 502, 503, 504],
+        status_forcelist=list(status_forcelist),
     )
 
     adapter = HTTPAdapter(max_retries=retry_strategy)
@@ -31,293 +63,418 @@ def create_session():
     return session
 
 
-def query_wikidata(symbol, session, max_retries=5, base_delay=5):
-    """查询Wikidata并处理错误"""
-
-    # 定义端点URL
-    endpoint_url = "https://query.wikidata.org/sparql"
-
-    # 定义三个独立的SPARQL查询
-    query_1 = """
-    SELECT ?ticker ?id
-        (GROUP_CONCAT(DISTINCT ?idLabel;separator="| | |") AS ?idLabels)
-        (GROUP_CONCAT(DISTINCT ?altLabel; separator = "| | |") AS ?aliases)
-        (GROUP_CONCAT(DISTINCT ?industryLabel; separator = "| | |") AS ?industries)
-        (GROUP_CONCAT(DISTINCT ?countryLabel; separator = "| | |") AS ?countries)
-        (GROUP_CONCAT(DISTINCT ?productLabel; separator = "| | |") AS ?products)
-    WHERE {
-        {
-            # Find the exchange and its ticker
-            ?id wdt:P414 ?exchange .
-            ?id p:P414 ?exchangesub .
-            ?exchangesub pq:P249 ?ticker . FILTER(UCASE(STR(?ticker)) = '""" + symbol + """') .
-            OPTIONAL { ?id rdfs:label ?idLabel . FILTER (LANG(?idLabel) = "en") }
-        }
-        OPTIONAL {
-            ?id skos:altLabel ?altLabel .
-            FILTER (LANG(?altLabel) = "en")
-        }
-        OPTIONAL {
-            ?id wdt:P452 ?industry .
-            ?industry rdfs:label ?industryLabel .
-            FILTER (LANG(?industryLabel) = "en")
-        }
-        OPTIONAL {
-            ?id wdt:P17 ?country .
-            ?country rdfs:label ?countryLabel .
-            FILTER (LANG(?countryLabel) = "en")
-        }
-        OPTIONAL {
-            ?id wdt:P1056 ?product .
-            ?product rdfs:label ?productLabel .
-            FILTER (LANG(?productLabel) = "en")
-        }
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+# 每个查询都找到交易所和股票代码，TICKER_FILTER 限定要查的代码
+QUERY_1 = """
+SELECT ?ticker ?id
+    (GROUP_CONCAT(DISTINCT ?idLabel;separator="| | |") AS ?idLabels)
+    (GROUP_CONCAT(DISTINCT ?altLabel; separator = "| | |") AS ?aliases)
+    (GROUP_CONCAT(DISTINCT ?industryLabel; separator = "| | |") AS ?industries)
+    (GROUP_CONCAT(DISTINCT ?countryLabel; separator = "| | |") AS ?countries)
+    (GROUP_CONCAT(DISTINCT ?productLabel; separator = "| | |") AS ?products)
+WHERE {
+    {
+        # Find the exchange and its ticker
+        ?id wdt:P414 ?exchange .
+        ?id p:P414 ?exchangesub .
+        ?exchangesub pq:P249 ?ticker . TICKER_FILTER
+        OPTIONAL { ?id rdfs:label ?idLabel . FILTER (LANG(?idLabel) = "en") }
     }
-    GROUP BY ?ticker ?id
-    """
-
-    query_2 = """
-    SELECT ?ticker ?id
-        (GROUP_CONCAT(DISTINCT ?idLabel;separator="| | |") AS ?idLabels)
-        (GROUP_CONCAT(DISTINCT CONCAT(?subsidiaryLabel, 
-            IF(BOUND(?start_time), CONCAT(" (Start: ", STR(?start_time), ")"), ""), 
-            IF(BOUND(?end_time), CONCAT(" (End: ", STR(?end_time), ")"), "")
-        );separator="| | |") AS ?subsidiaries)
-        (GROUP_CONCAT(DISTINCT CONCAT(?ownerOfLabel, 
-            IF(BOUND(?start_time_owner), CONCAT(" (Start: ", STR(?start_time_owner), ")"), ""), 
-            IF(BOUND(?end_time_owner), CONCAT(" (End: ", STR(?end_time_owner), ")"), "")
-        );separator="| | |") AS ?ownedEntities)
-    WHERE {
-        {
-            # Find the exchange and its ticker 
-            ?id wdt:P414 ?exchange . 
-            ?id p:P414 ?exchangesub .
-            ?exchangesub pq:P249 ?ticker . FILTER(UCASE(STR(?ticker)) = '""" + symbol + """') .
-            OPTIONAL { ?id rdfs:label ?idLabel . FILTER (LANG(?idLabel) = "en") }
-        }
-        OPTIONAL {
-            ?id wdt:P355 ?subsidiary .
-            ?subsidiary rdfs:label ?subsidiaryLabel .
-            FILTER (LANG(?subsidiaryLabel) = "en")
-            OPTIONAL { ?id p:P355 [ps:P355 ?subsidiary; pq:P580 ?start_time; pq:P582 ?end_time] }
-        }
-        OPTIONAL {
-            ?id wdt:P1830 ?ownerOf .
-            ?ownerOf rdfs:label ?ownerOfLabel .
-            FILTER (LANG(?ownerOfLabel) = "en")
-            OPTIONAL { ?id p:P1830 [ps:P1830 ?ownerOf; pq:P580 ?start_time_owner; pq:P582 ?end_time_owner] }
-        }
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+    OPTIONAL {
+        ?id skos:altLabel ?altLabel .
+        FILTER (LANG(?altLabel) = "en")
     }
-    GROUP BY ?ticker ?id
-    """
-
-    query_3 = """
-    SELECT ?ticker ?id
-        (GROUP_CONCAT(DISTINCT ?ceoLabel;separator="| | |") AS ?ceos)
-        (GROUP_CONCAT(DISTINCT CONCAT(?ceoLabel, 
-            IF(BOUND(?ceoStart), CONCAT(" (Start: ", STR(?ceoStart), ")"), ""), 
-            IF(BOUND(?ceoEnd), CONCAT(" (End: ", STR(?ceoEnd), ")"), "")
-        );separator="| | |") AS ?ceosWithTerms)
-        (GROUP_CONCAT(DISTINCT ?boardMemberLabel;separator="| | |") AS ?boardMembers)
-        (GROUP_CONCAT(DISTINCT CONCAT(?boardMemberLabel, 
-            IF(BOUND(?boardMemberStart), CONCAT(" (Start: ", STR(?boardMemberStart), ")"), ""), 
-            IF(BOUND(?boardMemberEnd), CONCAT(" (End: ", STR(?boardMemberEnd), ")"), "")
-        );separator="| | |") AS ?boardMembersWithTerms)
-        (GROUP_CONCAT(DISTINCT CONCAT(?legalFormLabel, 
-            IF(BOUND(?legalFormStart), CONCAT(" (Start: ", STR(?legalFormStart), ")"), ""), 
-            IF(BOUND(?legalFormEnd), CONCAT(" (End: ", STR(?legalFormEnd), ")"), "")
-        );separator="| | |") AS ?legalFormsWithDates)
-        (SAMPLE(?shortName) AS ?shortNames)
-    WHERE {
-        {
-            # Find the exchange and its ticker 
-            ?id wdt:P414 ?exchange . 
-            ?id p:P414 ?exchangesub .
-            ?exchangesub pq:P249 ?ticker . FILTER(UCASE(STR(?ticker)) = '""" + symbol + """') .
-        }
-        OPTIONAL {
-            ?id p:P169 ?ceoStatement .
-            ?ceoStatement ps:P169 ?ceo .
-            ?ceo rdfs:label ?ceoLabel .
-            FILTER (LANG(?ceoLabel) = "en")
-            OPTIONAL { ?ceoStatement pq:P580 ?ceoStart }
-            OPTIONAL { ?ceoStatement pq:P582 ?ceoEnd }
-        }
-        OPTIONAL {
-            ?id p:P3320 ?boardMemberStatement .
-            ?boardMemberStatement ps:P3320 ?boardMember .
-            ?boardMember rdfs:label ?boardMemberLabel .
-            FILTER (LANG(?boardMemberLabel) = "en")
-            OPTIONAL { ?boardMemberStatement pq:P580 ?boardMemberStart }
-            OPTIONAL { ?boardMemberStatement pq:P582 ?boardMemberEnd }
-        }
-        OPTIONAL {
-            ?id wdt:P1454 ?legalForm .
-            ?legalForm rdfs:label ?legalFormLabel .
-            FILTER (LANG(?legalFormLabel) = "en")
-            OPTIONAL {
-                ?id p:P1454 ?legalFormStatement .
-                ?legalFormStatement ps:P1454 ?legalForm .
-                OPTIONAL { ?legalFormStatement pq:P580 ?legalFormStart }
-                OPTIONAL { ?legalFormStatement pq:P582 ?legalFormEnd }
-            }
-        }
+    OPTIONAL {
+        ?id wdt:P452 ?industry .
+        ?industry rdfs:label ?industryLabel .
+        FILTER (LANG(?industryLabel) = "en")
+    }
+    OPTIONAL {
+        ?id wdt:P17 ?country .
+        ?country rdfs:label ?countryLabel .
+        FILTER (LANG(?countryLabel) = "en")
+    }
+    OPTIONAL {
+        ?id wdt:P1056 ?product .
+        ?product rdfs:label ?productLabel .
+        FILTER (LANG(?productLabel) = "en")
+    }
+    SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+}
+GROUP BY ?ticker ?id
+"""
+
+QUERY_2 = """
+SELECT ?ticker ?id
+    (GROUP_CONCAT(DISTINCT ?idLabel;separator="| | |") AS ?idLabels)
+    (GROUP_CONCAT(DISTINCT CONCAT(?subsidiaryLabel, 
+        IF(BOUND(?start_time), CONCAT(" (Start: ", STR(?start_time), ")"), ""), 
+        IF(BOUND(?end_time), CONCAT(" (End: ", STR(?end_time), ")"), "")
+    );separator="| | |") AS ?subsidiaries)
+    (GROUP_CONCAT(DISTINCT CONCAT(?ownerOfLabel, 
+        IF(BOUND(?start_time_owner), CONCAT(" (Start: ", STR(?start_time_owner), ")"), ""), 
+        IF(BOUND(?end_time_owner), CONCAT(" (End: ", STR(?end_time_owner), ")"), "")
+    );separator="| | |") AS ?ownedEntities)
+WHERE {
+    {
+        # Find the exchange and its ticker 
+        ?id wdt:P414 ?exchange . 
+        ?id p:P414 ?exchangesub .
+        ?exchangesub pq:P249 ?ticker . TICKER_FILTER
+        OPTIONAL { ?id rdfs:label ?idLabel . FILTER (LANG(?idLabel) = "en") }
+    }
+    OPTIONAL {
+        ?id wdt:P355 ?subsidiary .
+        ?subsidiary rdfs:label ?subsidiaryLabel .
+        FILTER (LANG(?subsidiaryLabel) = "en")
+        OPTIONAL { ?id p:P355 [ps:P355 ?subsidiary; pq:P580 ?start_time; pq:P582 ?end_time] }
+    }
+    OPTIONAL {
+        ?id wdt:P1830 ?ownerOf .
+        ?ownerOf rdfs:label ?ownerOfLabel .
+        FILTER (LANG(?ownerOfLabel) = "en")
+        OPTIONAL { ?id p:P1830 [ps:P1830 ?ownerOf; pq:P580 ?start_time_owner; pq:P582 ?end_time_owner] }
+    }
+    SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+}
+GROUP BY ?ticker ?id
+"""
+
+QUERY_3 = """
+SELECT ?ticker ?id
+    (GROUP_CONCAT(DISTINCT ?ceoLabel;separator="| | |") AS ?ceos)
+    (GROUP_CONCAT(DISTINCT CONCAT(?ceoLabel, 
+        IF(BOUND(?ceoStart), CONCAT(" (Start: ", STR(?ceoStart), ")"), ""), 
+        IF(BOUND(?ceoEnd), CONCAT(" (End: ", STR(?ceoEnd), ")"), "")
+    );separator="| | |") AS ?ceosWithTerms)
+    (GROUP_CONCAT(DISTINCT ?boardMemberLabel;separator="| | |") AS ?boardMembers)
+    (GROUP_CONCAT(DISTINCT CONCAT(?boardMemberLabel, 
+        IF(BOUND(?boardMemberStart), CONCAT(" (Start: ", STR(?boardMemberStart), ")"), ""), 
+        IF(BOUND(?boardMemberEnd), CONCAT(" (End: ", STR(?boardMemberEnd), ")"), "")
+    );separator="| | |") AS ?boardMembersWithTerms)
+    (GROUP_CONCAT(DISTINCT CONCAT(?legalFormLabel, 
+        IF(BOUND(?legalFormStart), CONCAT(" (Start: ", STR(?legalFormStart), ")"), ""), 
+        IF(BOUND(?legalFormEnd), CONCAT(" (End: ", STR(?legalFormEnd), ")"), "")
+    );separator="| | |") AS ?legalFormsWithDates)
+    (SAMPLE(?shortName) AS ?shortNames)
+WHERE {
+    {
+        # Find the exchange and its ticker 
+        ?id wdt:P414 ?exchange . 
+        ?id p:P414 ?exchangesub .
+        ?exchangesub pq:P249 ?ticker . TICKER_FILTER
+    }
+    OPTIONAL {
+        ?id p:P169 ?ceoStatement .
+        ?ceoStatement ps:P169 ?ceo .
+        ?ceo rdfs:label ?ceoLabel .
+        FILTER (LANG(?ceoLabel) = "en")
+        OPTIONAL { ?ceoStatement pq:P580 ?ceoStart }
+        OPTIONAL { ?ceoStatement pq:P582 ?ceoEnd }
+    }
+    OPTIONAL {
+        ?id p:P3320 ?boardMemberStatement .
+        ?boardMemberStatement ps:P3320 ?boardMember .
+        ?boardMember rdfs:label ?boardMemberLabel .
+        FILTER (LANG(?boardMemberLabel) = "en")
+        OPTIONAL { ?boardMemberStatement pq:P580 ?boardMemberStart }
+        OPTIONAL { ?boardMemberStatement pq:P582 ?boardMemberEnd }
+    }
+    OPTIONAL {
+        ?id wdt:P1454 ?legalForm .
+        ?legalForm rdfs:label ?legalFormLabel .
+        FILTER (LANG(?legalFormLabel) = "en")
         OPTIONAL {
-            ?id wdt:P1813 ?shortName .
-            FILTER (LANG(?shortName) = "en")
+            ?id p:P1454 ?legalFormStatement .
+            ?legalFormStatement ps:P1454 ?legalForm .
+            OPTIONAL { ?legalFormStatement pq:P580 ?legalFormStart }
+            OPTIONAL { ?legalFormStatement pq:P582 ?legalFormEnd }
         }
-        SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
     }
-    GROUP BY ?ticker ?id
+    OPTIONAL {
+        ?id wdt:P1813 ?shortName .
+        FILTER (LANG(?shortName) = "en")
+    }
+    SERVICE wikibase:label { bd:serviceParam wikibase:language "[AUTO_LANGUAGE],en". }
+}
+GROUP BY ?ticker ?id
+"""
+
+
+LIST_FIELDS = [
+    # (输出字段, 查询序号, 结果变量)
+    ('country', 0, 'countries'),
+    ('industry', 0, 'industries'),
+    ('aliases', 0, 'aliases'),
+    ('products', 0, 'products'),
+    ('subsidiaries', 1, 'subsidiaries'),
+    ('owned_entities', 1, 'ownedEntities'),
+    ('ceos', 2, 'ceosWithTerms'),
+    ('board_members', 2, 'boardMembersWithTerms'),
+]
+
+
+class QueryTimeout(Exception):
+    """端点在查询时间限制内没有完成查询"""
+
+
+class RateLimited(requests.exceptions.HTTPError):
+    """端点返回 429/503，retry_after 是 Retry-After 头"""
+
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}", response=response)
+        self.retry_after = response.headers.get('Retry-After')
+
+
+def build_queries(symbols):
+    """一个代码用原来的 FILTER，多个代码用 VALUES 块一次查询"""
+    if len(symbols) == 1:
+        ticker_filter = "FILTER(UCASE(STR(?ticker)) = '" + symbols[0] + "') ."
+    else:
+        values = ' '.join('"' + symbol.replace('"', '') + '"' for symbol in symbols)
+        ticker_filter = "VALUES ?symbol { " + values + " } FILTER(UCASE(STR(?ticker)) = ?symbol) ."
+    return [query.replace('TICKER_FILTER', ticker_filter) for query in (QUERY_1, QUERY_2, QUERY_3)]
+
+
+def backoff_delay(attempt, base_delay=5):
+    # 指数退避加随机抖动，顺序批量模式和并发模式共用
+    return base_delay * (3 ** attempt) + random.uniform(10, 20)
+
+
+def parse_retry_after(value):
+    """Retry-After 头的秒数，可以是秒数或 HTTP 日期；无法解析返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class RequestLimiter:
+    """所有线程共用的限速器
+
+    每个请求之前调用 wait()，请求开始之间至少间隔 interval 秒。
+    rate_limited() 按 Retry-After 暂停所有线程并把间隔加倍，
+    之后每个成功的请求把间隔慢慢缩回 1 / rate。
     """
 
+    def __init__(self, rate=REQUESTS_PER_SECOND):
+        self.min_interval = 1.0 / rate
+        self.interval = self.min_interval
+        self.next_time = 0.0
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                start = max(now, self.next_time, self.paused_until)
+                self.next_time = start + self.interval
+            time.sleep(start - now)
+            # 等待期间其他线程遇到了限速，重新排队
+            if self.paused_until <= time.monotonic():
+                return
+
+    def rate_limited(self, retry_after=None):
+        seconds = parse_retry_after(retry_after)
+        if seconds is None:
+            seconds = RATE_LIMIT_WAIT
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.interval = min(MAX_REQUEST_INTERVAL, self.interval * 2)
+        print(f"遇到限速，所有请求暂停 {seconds:.1f} 秒，请求间隔 {self.interval:.1f} 秒")
+
+    def succeeded(self):
+        with self.lock:
+            self.interval = max(self.min_interval, self.interval * 0.9)
+
+
+thread_state = threading.local()
+
+
+def thread_session():
+    # requests.Session 不保证线程安全，每个线程一个会话；会话本身不重试，
+    # 连接错误、429/503 和 5xx 都由 run_query 通过限速器退避后重试
+    if not hasattr(thread_state, 'session'):
+        thread_state.session = create_session(status_forcelist=(), read_retries=False, retries=0)
+    return thread_state.session
+
+
+def get_response_cache():
+    # 第一次查询时才打开缓存，导入模块不会创建 .sparql_cache.db；不用缓存时返回 None
+    global response_cache
+    if not use_response_cache:
+        return None
+    with response_cache_lock:
+        if response_cache is None:
+            response_cache = SparqlCache()
+    return response_cache
+
+
+def is_cached(query):
+    cache = get_response_cache()
+    return cache is not None and cache.get(query) is not None
+
+
+def is_read_timeout(error):
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, ReadTimeoutError)
+
+
+def run_query(session, query, limiter=None, max_retries=5):
+    """发送一个查询，返回 bindings
+
+    只有读取超时和端点的 TimeoutException 抛出 QueryTimeout；429/503 在有 limiter 时
+    按 Retry-After 等待后重试，否则抛出 RateLimited 交给调用者退避。
+    有 limiter 时连接错误等其他请求异常和 5xx 也退避后重试，重试用完才抛出
+    """
+    cache = get_response_cache()
+    if cache is not None:
+        data = cache.get(query)
+        if data is not None:
+            return data['results']['bindings']
     for attempt in range(max_retries):
+        if limiter is not None:
+            limiter.wait()
         try:
-            print(f"查询 {symbol} (尝试 {attempt + 1}/{max_retries})")
-
-            # 发送三个独立的请求
-            response_1 = session.get(
-                endpoint_url,
-                params={'query': query_1, 'format': 'json'},
-                timeout=(15, 60)
+            response = session.get(
+                ENDPOINT_URL,
+                params={'query': query, 'format': 'json'},
+                timeout=QUERY_TIMEOUT
             )
+        except requests.exceptions.ReadTimeout as e:
+            raise QueryTimeout(str(e))
+        except requests.exceptions.RequestException as e:
+            # 会话重试读取超时用尽时 requests 抛出的是 ConnectionError
+            if is_read_timeout(e):
+                raise QueryTimeout(str(e))
+            # 连接中断、重试用尽 (RetryError) 等，顺序模式由调用者退避
+            if limiter is None or attempt == max_retries - 1:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"请求失败: {e}，{delay:.1f} 秒后重试")
+            time.sleep(delay)
+            continue
+        if response.status_code in (429, 503):
+            if limiter is not None and attempt < max_retries - 1:
+                limiter.rate_limited(response.headers.get('Retry-After'))
+                continue
+            raise RateLimited(response)
+        if limiter is not None and response.ok:
+            limiter.succeeded()
+        # 查询超时时 Wikidata 返回 500 和 TimeoutException
+        if response.status_code in (500, 504) and 'TimeoutException' in response.text:
+            raise QueryTimeout(f"HTTP {response.status_code}")
+        if limiter is not None and response.status_code >= 500 and attempt < max_retries - 1:
+            delay = backoff_delay(attempt)
+            print(f"HTTP {response.status_code}，{delay:.1f} 秒后重试")
+            time.sleep(delay)
+            continue
+        response.raise_for_status()
+        data = response.json()
+        if cache is not None:
+            cache.put(query, data)
+        return data['results']['bindings']
 
-            # 在请求之间添加短暂延迟
-            time.sleep(random.uniform(1, 3))
 
-            response_2 = session.get(
-                endpoint_url,
-                params={'query': query_2, 'format': 'json'},
-                timeout=(15, 60)
-            )
+def split_values(value):
+    # 拆分 GROUP_CONCAT 的结果并清理空字符串
+    return [v for v in value.split('| | |') if v.strip()] if value else []
 
-            time.sleep(random.uniform(1, 3))
 
-            response_3 = session.get(
-                endpoint_url,
-                params={'query': query_3, 'format': 'json'},
-                timeout=(15, 60)
-            )
+def entity_id(result):
+    # ?id 是实体 URI，只保留 Q 编号
+    return result.get('id', {}).get('value', '').rsplit('/', 1)[-1]
 
-            if response_1.ok and response_2.ok and response_3.ok:
-                # 处理三个查询的结果
-                data_1 = response_1.json()
-                data_2 = response_2.json()
-                data_3 = response_3.json()
-
-                all_results = []
-
-                # 假设所有查询返回相同数量的结果行
-                max_results = max(
-                    len(data_1['results']['bindings']),
-                    len(data_2['results']['bindings']),
-                    len(data_3['results']['bindings'])
-                )
-
-                for i in range(max_results):
-                    # 安全地获取每个查询的结果
-                    result_1 = data_1['results']['bindings'][i] if i < len(data_1['results']['bindings']) else {}
-                    result_2 = data_2['results']['bindings'][i] if i < len(data_2['results']['bindings']) else {}
-                    result_3 = data_3['results']['bindings'][i] if i < len(data_3['results']['bindings']) else {}
-
-                    entry = {
-                        'id_label': result_1.get('idLabels', {}).get('value', ''),
-                        'ticker': result_1.get('ticker', {}).get('value', symbol),
-                        'country': result_1.get('countries', {}).get('value', '').split('| | |') if result_1.get(
-                            'countries', {}).get('value') else [],
-                        'industry': result_1.get('industries', {}).get('value', '').split('| | |') if result_1.get(
-                            'industries', {}).get('value') else [],
-                        'aliases': result_1.get('aliases', {}).get('value', '').split('| | |') if result_1.get(
-                            'aliases', {}).get('value') else [],
-                        'products': result_1.get('products', {}).get('value', '').split('| | |') if result_1.get(
-                            'products', {}).get('value') else [],
-                        'subsidiaries': result_2.get('subsidiaries', {}).get('value', '').split(
-                            '| | |') if result_2.get('subsidiaries', {}).get('value') else [],
-                        'owned_entities': result_2.get('ownedEntities', {}).get('value', '').split(
-                            '| | |') if result_2.get('ownedEntities', {}).get('value') else [],
-                        'ceos': result_3.get('ceosWithTerms', {}).get('value', '').split('| | |') if result_3.get(
-                            'ceosWithTerms', {}).get('value') else [],
-                        'board_members': result_3.get('boardMembersWithTerms', {}).get('value', '').split(
-                            '| | |') if result_3.get('boardMembersWithTerms', {}).get('value') else [],
-                    }
-
-                    # 清理空字符串
-                    entry['country'] = [c for c in entry['country'] if c.strip()]
-                    entry['industry'] = [i for i in entry['industry'] if i.strip()]
-                    entry['aliases'] = [a for a in entry['aliases'] if a.strip()]
-                    entry['products'] = [p for p in entry['products'] if p.strip()]
-                    entry['subsidiaries'] = [s for s in entry['subsidiaries'] if s.strip()]
-                    entry['owned_entities'] = [o for o in entry['owned_entities'] if o.strip()]
-                    entry['ceos'] = [c for c in entry['ceos'] if c.strip()]
-                    entry['board_members'] = [b for b in entry['board_members'] if b.strip()]
-
-                    all_results.append(entry)
-
-                # 如果没有结果，创建一个空的条目
-                if not all_results:
-                    all_results.append({
-                        'id_label': '',
-                        'ticker': symbol,
-                        'country': [],
-                        'industry': [],
-                        'aliases': [],
-                        'products': [],
-                        'subsidiaries': [],
-                        'owned_entities': [],
-                        'ceos': [],
-                        'board_members': [],
-                    })
-
-                # 确保目录存在
-                os.makedirs('info/Icahn', exist_ok=True)
-
-                # 创建并写入JSON
-                file_path = os.path.join('info', 'Icahn', f'{symbol}_info.json')
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(all_results, f, indent=4, ensure_ascii=False)
-
-                print(f"成功保存 {symbol} 的信息")
-
-                # 成功后添加随机延迟
-                delay = random.uniform(5, 10)  # 增加延迟时间
-                print(f"等待 {delay:.1f} 秒...")
-                time.sleep(delay)
-                return True
 
-            else:
-                # 检查哪个请求失败了
-                failed_responses = []
-                if not response_1.ok:
-                    failed_responses.append(f"Query 1: {response_1.status_code}")
-                if not response_2.ok:
-                    failed_responses.append(f"Query 2: {response_2.status_code}")
-                if not response_3.ok:
-                    failed_responses.append(f"Query 3: {response_3.status_code}")
-
-                print(f"请求失败: {', '.join(failed_responses)}")
-
-                # 特别处理429错误
-                if any(r.status_code == 429 for r in [response_1, response_2, response_3]):
-                    print(f"遇到429错误 - 请求过于频繁")
-                    if attempt < max_retries - 1:
-                        wait_time = base_delay * (3 ** attempt) + random.uniform(10, 20)
-                        print(f"等待 {wait_time:.1f} 秒后重试...")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"达到最大重试次数，跳过 {symbol}")
-                        return False
-                else:
-                    if attempt < max_retries - 1:
-                        wait_time = base_delay * (2 ** attempt) + random.uniform(2, 8)
-                        print(f"等待 {wait_time:.1f} 秒后重试...")
-                        time.sleep(wait_time)
+def join_results(*result_sets):
+    """按 (ticker, 实体 id) 哈希连接几个查询的结果，返回 [((ticker, id), [每个查询的行])]
 
-        except requests.exceptions.RequestException as e:
-            print(f"请求异常: {e}")
+    三个查询都按 ?ticker ?id 分组，同一家公司在几个交易所上市时行的顺序各不相同，
+    所以不能按位置合并。任一查询有的 (ticker, id) 都保留，缺的查询用 {}。
+    """
+    joined = {}
+    for index, results in enumerate(result_sets):
+        for result in results:
+            key = (result.get('ticker', {}).get('value'), entity_id(result))
+            joined.setdefault(key, [{} for _ in result_sets])[index] = result
+    return list(joined.items())
+
+
+def build_entries(symbol, results_1, results_2, results_3):
+    """把三个查询对同一个代码的结果合并成 {symbol}_info.json 的条目"""
+    all_results = []
+    for (ticker, entity), results in join_results(results_1, results_2, results_3):
+        entry = {
+            'id': entity,
+            'id_label': (results[0].get('idLabels') or results[1].get('idLabels', {})).get('value', ''),
+            'ticker': ticker or symbol,
+        }
+        for field, index, variable in LIST_FIELDS:
+            entry[field] = split_values(results[index].get(variable, {}).get('value'))
+        all_results.append(entry)
+
+    # 如果没有结果，创建一个空的条目
+    if not all_results:
+        all_results.append({'id': '', 'id_label': '', 'ticker': symbol, **{field: [] for field, _, _ in LIST_FIELDS}})
+    return all_results
+
+
+def save_info(symbol, all_results):
+    os.makedirs(INFO_FOLDER, exist_ok=True)
+    file_path = os.path.join(INFO_FOLDER, f'{symbol}_info.json')
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(all_results, f, indent=4, ensure_ascii=False)
+
+
+def split_by_symbol(bindings):
+    """按大写的股票代码拆分一个批量查询的结果"""
+    by_symbol = {}
+    for result in bindings:
+        by_symbol.setdefault(result.get('ticker', {}).get('value', '').upper(), []).append(result)
+    return by_symbol
+
+
+def query_wikidata(symbol, session, max_retries=5, base_delay=5):
+    """查询Wikidata并处理错误"""
+    for attempt in range(max_retries):
+        try:
+            print(f"查询 {symbol} (尝试 {attempt + 1}/{max_retries})")
+
+            # 发送三个独立的请求，请求之间添加短暂延迟；全部来自缓存时不用等待
+            queries = build_queries([symbol])
+            from_cache = all(is_cached(query) for query in queries)
+            data = []
+            for query in queries:
+                if data and not from_cache:
+                    time.sleep(random.uniform(1, 3))
+                data.append(run_query(session, query))
+
+            save_info(symbol, build_entries(symbol, *data))
+            print(f"成功保存 {symbol} 的信息")
+            if from_cache:
+                return True
+
+            # 成功后添加随机延迟
+            delay = random.uniform(5, 10)  # 增加延迟时间
+            print(f"等待 {delay:.1f} 秒...")
+            time.sleep(delay)
+            return True
+
+        except (QueryTimeout, requests.exceptions.RequestException) as e:
+            print(f"请求失败: {e}")
+            # 特别处理429错误
+            too_many = isinstance(e, requests.exceptions.HTTPError) and e.response.status_code == 429
+            if too_many:
+                print(f"遇到429错误 - 请求过于频繁")
             if attempt < max_retries - 1:
-                wait_time = base_delay * (2 ** attempt) + random.uniform(5, 15)
+                wait_time = base_delay * ((3 if too_many else 2) ** attempt) + random.uniform(5, 15)
                 print(f"等待 {wait_time:.1f} 秒后重试...")
                 time.sleep(wait_time)
             else:
@@ -337,6 +494,134 @@ def query_wikidata(symbol, session, max_retries=5, base_delay=5):
     return False
 
 
+def query_wikidata_batch(symbols, session):
+    """一次查询多个代码，返回 {symbol: 条目}；端点超时抛出 QueryTimeout"""
+    queries = build_queries(symbols)
+    from_cache = all(is_cached(query) for query in queries)
+    data = []
+    for query in queries:
+        if data and not from_cache:
+            time.sleep(random.uniform(1, 3))
+        data.append(split_by_symbol(run_query(session, query)))
+    return dict((symbol, build_entries(symbol, *(d.get(symbol, []) for d in data))) for symbol in symbols)
+
+
+def fetch_batch(symbols, query_pool, limiter):
+    """并发模式下的 query_wikidata_batch: 三个查询在 query_pool 里同时发送"""
+    futures = [query_pool.submit(lambda q: run_query(thread_session(), q, limiter), query)
+               for query in build_queries(symbols)]
+    data = [split_by_symbol(future.result()) for future in futures]
+    return dict((symbol, build_entries(symbol, *(d.get(symbol, []) for d in data))) for symbol in symbols)
+
+
+def fetch_concurrently(symbols, progress, batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """同时查询 max_workers 个批次并保存每个代码的文件；超时的批次拆成两半重新提交"""
+    processed_symbols = set(progress['processed'])
+    failed_symbols = set(progress['failed'])
+    limiter = RequestLimiter()
+    with ThreadPoolExecutor(max_workers=max_workers * 3) as query_pool, \
+            ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+
+        def submit(batch):
+            futures[pool.submit(fetch_batch, batch, query_pool, limiter)] = batch
+
+        for start in range(0, len(symbols), batch_size):
+            submit(symbols[start:start + batch_size])
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            # 进度只在主线程里更新和保存
+            for future in done:
+                batch = futures.pop(future)
+                try:
+                    results = future.result()
+                except QueryTimeout as e:
+                    print(f"查询超时: {e}")
+                    if len(batch) > 1:
+                        print(f"拆分 {len(batch)} 个代码的批次")
+                        submit(batch[:len(batch) // 2])
+                        submit(batch[len(batch) // 2:])
+                    else:
+                        print(f"单个代码也超时，跳过 {batch[0]}")
+                        failed_symbols.add(batch[0])
+                    continue
+                except Exception as e:
+                    print(f"请求失败，跳过 {', '.join(batch)}: {e}")
+                    failed_symbols.update(batch)
+                    continue
+                for symbol, all_results in results.items():
+                    save_info(symbol, all_results)
+                    processed_symbols.add(symbol)
+                    failed_symbols.discard(symbol)
+                print(f"成功保存 {len(results)} 个代码的信息，剩余 {sum(len(b) for b in futures.values())}")
+            progress = {'processed': list(processed_symbols), 'failed': list(failed_symbols)}
+            save_progress(progress)
+    return progress
+
+
+def query_batches(symbols, session, progress, max_retries=5, base_delay=5):
+    """批量查询 symbols 并保存每个代码的文件；超时的批次减半重试，单个代码也超时则记为失败"""
+    processed_symbols = set(progress['processed'])
+    failed_symbols = set(progress['failed'])
+    batch_size = BATCH_SIZE
+    attempt = 0
+    while symbols:
+        batch = symbols[:batch_size]
+        try:
+            print(f"批量查询 {len(batch)} 个代码: {batch[0]} ... {batch[-1]}，剩余 {len(symbols)}")
+            from_cache = all(is_cached(query) for query in build_queries(batch))
+            results = query_wikidata_batch(batch, session)
+        except QueryTimeout as e:
+            print(f"查询超时: {e}")
+            if batch_size > 1:
+                batch_size = max(1, len(batch) // 2)
+                print(f"批次减小到 {batch_size}")
+            else:
+                print(f"单个代码也超时，跳过 {batch[0]}")
+                failed_symbols.add(batch[0])
+                symbols = symbols[1:]
+            continue
+        except Exception as e:
+            print(f"请求异常: {e}")
+            attempt += 1
+            if attempt < max_retries:
+                # 限速时按 Retry-After 等待，没有这个头或其他错误时指数退避；批次不缩小
+                wait_time = parse_retry_after(getattr(e, 'retry_after', None))
+                if wait_time is None:
+                    wait_time = backoff_delay(attempt, base_delay)
+                print(f"等待 {wait_time:.1f} 秒后重试...")
+                time.sleep(wait_time)
+            else:
+                print(f"达到最大重试次数，跳过 {', '.join(batch)}")
+                failed_symbols.update(batch)
+                symbols = symbols[len(batch):]
+                attempt = 0
+            continue
+
+        for symbol, all_results in results.items():
+            save_info(symbol, all_results)
+            processed_symbols.add(symbol)
+            failed_symbols.discard(symbol)
+        print(f"成功保存 {len(results)} 个代码的信息")
+        symbols = symbols[len(batch):]
+        attempt = 0
+        # 成功后批次逐步恢复
+        batch_size = min(BATCH_SIZE, batch_size * 2)
+
+        progress = {'processed': list(processed_symbols), 'failed': list(failed_symbols)}
+        save_progress(progress)
+        if from_cache:
+            continue
+
+        delay = random.uniform(5, 10)
+        print(f"等待 {delay:.1f} 秒...")
+        time.sleep(delay)
+
+    progress = {'processed': list(processed_symbols), 'failed': list(failed_symbols)}
+    save_progress(progress)
+    return progress
+
+
 def load_progress():
     """加载进度记录"""
     progress_file = 'progress.json'
@@ -354,8 +639,12 @@ def save_progress(progress):
 
 
 def main():
-    # 创建会话
-    session = create_session()
+    # 创建会话; 批量模式下超时的 500 和读取超时不重试，直接缩小批次；
+    # 429/503 也不在会话里重试，由 query_batches 按 Retry-After 等待
+    if use_batched_queries:
+        session = create_session(status_forcelist=(502,), read_retries=False)
+    else:
+        session = create_session()
 
     # 读取CSV文件
     try:
@@ -375,11 +664,30 @@ def main():
     print(f"已处理: {successful_queries}, 已失败: {failed_queries}")
     print(f"总共需要处理: {len(ticker_df)}")
 
+    if use_concurrent_fetch or use_batched_queries:
+        symbols = []
+        for symbol in ticker_df['Symbol'].astype(str).str.strip().str.upper():
+            file_exists = os.path.exists(os.path.join(INFO_FOLDER, f'{symbol}_info.json'))
+            if not (symbol in processed_symbols and file_exists) and symbol not in symbols:
+                symbols.append(symbol)
+        print(f"需要查询: {len(symbols)}")
+        progress = {'processed': list(processed_symbols), 'failed': list(failed_symbols)}
+        if use_concurrent_fetch:
+            progress = fetch_concurrently(symbols, progress, BATCH_SIZE if use_batched_queries else 1)
+        else:
+            progress = query_batches(symbols, session, progress)
+        print(f"\n处理完成!")
+        print(f"成功: {len(progress['processed'])}")
+        print(f"失败: {len(progress['failed'])}")
+        if progress['failed']:
+            print(f"失败的股票代码: {', '.join(progress['failed'])}")
+        return
+
     for index, row in ticker_df.iterrows():
         symbol = str(row['Symbol']).strip().upper()
 
         # 检查文件是否实际存在
-        file_path = os.path.join('info', 'ticker2', f'{symbol}_info.json')
+        file_path = os.path.join(INFO_FOLDER, f'{symbol}_info.json')
         file_exists = os.path.exists(file_path)
 
         # 跳过已经处理过且文件存在的
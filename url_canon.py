@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+
+# Scheme, host (with port) and the rest of the URL up to the fragment
+URL_PATTERN = r'^\s*(?P<scheme>[A-Za-z][A-Za-z0-9+.-]*)://(?P<host>[^/?#\s]+)(?P<rest>[^#\s]*)'
+
+# Per site rules, keyed by the canonical host
+#   aliases:         other hosts serving the same pages
+#   https:           always use https
+#   truncate_after:  cut the URL right after this marker (query, tracking suffixes)
+#   require_marker:  URLs without the marker are not articles and are rejected
+#   reject:          substrings of broken URLs the archive holds (e.g. unescaped '%' or quotes)
+SITE_RULES = {
+    'finance.yahoo.com': {
+        'aliases': ['www.finance.yahoo.com'],
+        'https': True,
+        'truncate_after': '.html',
+        'require_marker': True,
+        'reject': ['news/%', "news/'"],
+    },
+}
+
+
+def canonicalize(urls):
+    """Canonical form of every URL in urls, vectorized over the whole array.
+
+    Scheme and host are lowercased, default ports and fragments are dropped,
+    then the rules of the URL's site are applied. Returns a Series aligned
+    with urls holding None where the URL is rejected.
+    """
+    s = pd.Series(urls, dtype=object).astype(str)
+    parts = s.str.extract(URL_PATTERN)
+    rejected = parts['scheme'].isna()
+    scheme = parts['scheme'].str.lower()
+    host = parts['host'].str.lower().str.replace(r':(?:80|443)?$', '', regex=True)
+    rest = parts['rest'].fillna('')
+    rest = rest.where(rest != '', '/')
+
+    for site, rules in SITE_RULES.items():
+        mask = host.isin([site] + rules.get('aliases', []))
+        if not mask.any():
+            continue
+        host[mask] = site
+        if rules.get('https'):
+            scheme[mask] = 'https'
+        path = rest[mask]
+        marker = rules.get('truncate_after')
+        if marker:
+            found = path.str.contains(marker, regex=False)
+            path = path.where(~found, path.str.split(marker, n=1, regex=False).str[0] + marker)
+            if rules.get('require_marker'):
+                rejected[mask] |= ~found
+        for bad in rules.get('reject', []):
+            rejected[mask] |= path.str.contains(bad, regex=False)
+        rest[mask] = path
+
+    # object dtype, so rejected URLs are None rather than NaN of a string column
+    canonical = (scheme + '://' + host + rest).astype(object)
+    return canonical.where(~rejected, None)
+
+
+def fingerprint(canonical):
+    """64-bit fingerprints of canonical URLs (uint64), stable across runs and processes."""
+    return pd.util.hash_array(np.asarray(canonical, dtype=object))
+
+
+def canonicalize_frame(df, column='url', fingerprint_column=None):
+    """Replaces df[column] by the canonical URLs, drops rejected rows and keeps the first row per URL.
+
+    With fingerprint_column, the fingerprints are kept in that column.
+    """
+    canonical = canonicalize(df[column].to_numpy())
+    valid = canonical.notna().to_numpy()
+    df = df[valid].copy()
+    df[column] = canonical[valid].to_numpy()
+    fingerprints = fingerprint(df[column])
+    first = ~pd.Series(fingerprints).duplicated().to_numpy()
+    df = df[first].copy()
+    if fingerprint_column:
+        df[fingerprint_column] = fingerprints[first]
+    return df
+
+
+def unseen_mask(urls, known_urls):
+    """Boolean array, True where a URL is valid and no URL of known_urls has the same canonical form."""
+    canonical = canonicalize(urls)
+    valid = canonical.notna().to_numpy()
+    known = canonicalize(known_urls).dropna()
+    fingerprints = fingerprint(canonical.fillna(''))
+    return valid & ~np.isin(fingerprints, fingerprint(known))
@@ -0,0 +1,242 @@
+import bz2
+import csv
+import gzip
+import json
+import multiprocessing as mp
+import os
+import sqlite3
+from collections import deque
+
+# Builds the {SYM}_info.json files of ticker_symbol_query_rate_limit_protected.py from a
+# local Wikidata JSON dump (latest-all.json.bz2 / .gz) instead of the SPARQL endpoint.
+# The dump is read once: pool workers parse batches of lines, returning the companies
+# (entities with a P414 stock exchange and a P249 ticker qualifier) and the English
+# label of every entity. Labels go to a SQLite file, since the companies' industries,
+# people and subsidiaries can come anywhere in the dump; they are looked up at the end.
+
+DUMP_BATCH_LINES = 2000  # Dump lines parsed per pool task
+LABEL_BATCH = 500  # Ids per label lookup
+
+EXCHANGE, TICKER = 'P414', 'P249'
+START, END = 'P580', 'P582'
+# Same values as the three SPARQL queries:
+# truthy (wdt:) values, label only
+LABEL_FIELDS = [('country', 'P17'), ('industry', 'P452'), ('products', 'P1056')]
+# truthy values, with start and end when a statement has both
+PERIOD_FIELDS = [('subsidiaries', 'P355'), ('owned_entities', 'P1830')]
+# every statement (p:), start and end each optional
+TERM_FIELDS = [('ceos', 'P169'), ('board_members', 'P3320')]
+
+
+def open_dump(path):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def snak_value(snak):
+    # Value of a snak, None for "unknown value" / "no value"
+    if snak.get('snaktype') != 'value':
+        return None
+    value = snak['datavalue']['value']
+    if isinstance(value, dict):
+        if 'id' in value:
+            return value['id']
+        if 'time' in value:
+            # STR() of an xsd:dateTime in SPARQL has no leading +
+            return value['time'].lstrip('+')
+    return value
+
+
+def qualifier(statement, prop):
+    for snak in statement.get('qualifiers', {}).get(prop, []):
+        value = snak_value(snak)
+        if value is not None:
+            return value
+    return None
+
+
+def truthy(statements):
+    # What wdt: returns: preferred statements if there are any, else the normal ones
+    preferred = [s for s in statements if s.get('rank') == 'preferred']
+    return preferred or [s for s in statements if s.get('rank') == 'normal']
+
+
+def unique(values):
+    return list(dict.fromkeys(values))
+
+
+def company_record(entity):
+    """The fields a company needs for its info entries, with entity ids instead of labels. None if no ticker."""
+    claims = entity.get('claims', {})
+    exchanges = claims.get(EXCHANGE, [])
+    if not truthy(exchanges):
+        return None
+    # Tickers are P249 qualifiers of any P414 statement
+    tickers = unique(value for s in exchanges for value in map(snak_value, s.get('qualifiers', {}).get(TICKER, []))
+                     if isinstance(value, str))
+    if not tickers:
+        return None
+
+    record = {
+        'id': entity['id'],
+        'label': entity.get('labels', {}).get('en', {}).get('value', ''),
+        'aliases': unique(a['value'] for a in entity.get('aliases', {}).get('en', [])),
+        'tickers': tickers,
+    }
+    for field, prop in LABEL_FIELDS:
+        values = (snak_value(s['mainsnak']) for s in truthy(claims.get(prop, [])))
+        record[field] = [(v, None, None) for v in unique(values) if v is not None]
+    for field, prop in PERIOD_FIELDS:
+        statements = claims.get(prop, [])
+        record[field] = []
+        for value in unique(snak_value(s['mainsnak']) for s in truthy(statements)):
+            if value is None:
+                continue
+            periods = [(qualifier(s, START), qualifier(s, END)) for s in statements
+                       if snak_value(s['mainsnak']) == value]
+            periods = [p for p in periods if p[0] is not None and p[1] is not None] or [(None, None)]
+            record[field].extend((value, start, end) for start, end in periods)
+    for field, prop in TERM_FIELDS:
+        record[field] = [(snak_value(s['mainsnak']), qualifier(s, START), qualifier(s, END))
+                         for s in claims.get(prop, []) if snak_value(s['mainsnak']) is not None]
+    return record
+
+
+def parse_lines(lines):
+    """(company records, [(numeric id, English label)]) of a batch of dump lines."""
+    companies = []
+    labels = []
+    for line in lines:
+        line = line.strip().rstrip(',')
+        if line in ('', '[', ']'):
+            continue
+        entity = json.loads(line)
+        label = entity.get('labels', {}).get('en', {}).get('value')
+        if label is not None and entity['id'].startswith('Q'):
+            labels.append((int(entity['id'][1:]), label))
+        # Cheap test on the raw line before looking at the claims
+        if '"' + TICKER + '"' in line:
+            record = company_record(entity)
+            if record is not None:
+                companies.append(record)
+    return companies, labels
+
+
+def iter_batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def with_period(label, start, end):
+    # Same text as the CONCAT(... " (Start: " ...) of the SPARQL queries
+    return label + (f" (Start: {start})" if start else "") + (f" (End: {end})" if end else "")
+
+
+def resolve_labels(conn, ids):
+    labels = {}
+    numeric = sorted(int(i[1:]) for i in ids if i.startswith('Q'))
+    for start in range(0, len(numeric), LABEL_BATCH):
+        batch = numeric[start:start + LABEL_BATCH]
+        query = f"SELECT id, label FROM labels WHERE id IN ({','.join('?' * len(batch))})"
+        labels.update((f'Q{i}', label) for i, label in conn.execute(query, batch))
+    return labels
+
+
+def info_entries(record, ticker, labels):
+    """One entry of a {SYM}_info.json, as built from the SPARQL results."""
+    def field_labels(field):
+        # Values without an English label are dropped, like the FILTER(LANG(...) = "en") of the queries
+        return unique(with_period(labels[v], start, end) for v, start, end in record[field] if v in labels)
+
+    return {
+        'id': record['id'],
+        'id_label': record['label'],
+        'ticker': ticker,
+        'country': field_labels('country'),
+        'industry': field_labels('industry'),
+        'aliases': record['aliases'],
+        'products': field_labels('products'),
+        'subsidiaries': field_labels('subsidiaries'),
+        'owned_entities': field_labels('owned_entities'),
+        'ceos': field_labels('ceos'),
+        'board_members': field_labels('board_members'),
+    }
+
+
+def build_entities(dump_path, output_folder, symbols=None, processes=None):
+    """Writes output_folder/{SYM}_info.json for every ticker of the dump (or only symbols). Returns the number of files written."""
+    os.makedirs(output_folder, exist_ok=True)
+    wanted = set(s.upper() for s in symbols) if symbols is not None else None
+    labels_path = os.path.join(output_folder, '.dump_labels.db')
+    if os.path.exists(labels_path):
+        os.remove(labels_path)
+    conn = sqlite3.connect(labels_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("CREATE TABLE labels (id INTEGER PRIMARY KEY, label TEXT)")
+
+    # At most max_pending batches are read ahead of the workers
+    processes = processes or mp.cpu_count()
+    max_pending = 2 * processes
+    pending = deque()
+    companies = []
+    lines_read = 0
+
+    def collect():
+        found, labels = pending.popleft().get()
+        companies.extend(r for r in found if wanted is None or any(t.upper() in wanted for t in r['tickers']))
+        conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", labels)
+
+    with open_dump(dump_path) as dump, mp.Pool(processes=processes) as pool:
+        for batch in iter_batches(dump, DUMP_BATCH_LINES):
+            pending.append(pool.apply_async(parse_lines, (batch,)))
+            lines_read += len(batch)
+            while len(pending) >= max_pending:
+                collect()
+            if lines_read % (DUMP_BATCH_LINES * 500) == 0:
+                print(f"{lines_read} lines, {len(companies)} companies")
+        while pending:
+            collect()
+    conn.commit()
+
+    referenced = set(v for r in companies for field, _ in LABEL_FIELDS + PERIOD_FIELDS + TERM_FIELDS
+                     for v, _, _ in r[field])
+    labels = resolve_labels(conn, referenced)
+    conn.close()
+    os.remove(labels_path)
+
+    # Grouped like the SPARQL results: one entry per (ticker, entity), one file per upper-cased ticker
+    files = {}
+    for record in companies:
+        for ticker in record['tickers']:
+            symbol = ticker.upper()
+            if wanted is None or symbol in wanted:
+                files.setdefault(symbol, []).append(info_entries(record, ticker, labels))
+    for symbol, all_results in files.items():
+        file_path = os.path.join(output_folder, f"{symbol.replace(os.sep, '_')}_info.json")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=4, ensure_ascii=False)
+    print(f"{len(companies)} companies, {len(files)} ticker files written to {output_folder}")
+    return len(files)
+
+
+if __name__ == '__main__':
+    dump_path = 'latest-all.json.bz2'
+    output_folder = os.path.join('info', 'wikidata')
+    # CSV with a Symbol column, or None for every ticker in the dump
+    symbols_file = 'sp500list.csv'
+
+    symbols = None
+    if symbols_file:
+        with open(symbols_file, 'r', encoding='utf-8') as f:
+            symbols = [row['Symbol'].strip() for row in csv.DictReader(f)]
+    build_entities(dump_path, output_folder, symbols)
@@ -8,15 +8,19 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 import time
 import os
-import glob
 import datetime
 import pandas as pd
 import multiprocessing as mp
 
 from multiprocessing import Pool, Manager, Lock
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import traceback
 
+import cdx_client
+import link_parts
+
 num_process=10
+num_cdx_threads = 4  # Parallel CDX API requests, the Wayback Machine throttles aggressive clients
 opti = Options()
 opti.set_preference("permissions.default.image", 2)
 opti.set_preference("javascript.enabled", False)
@@ -28,10 +32,14 @@ serv = Service(executable_path='geckodriver')
 char_list = ['a','b','c','d','e','f','g','h','i','j','k','l','m','n','o','p','q','r','s','t','u','v','w','x','y','z','1','2','3','4','5','6','7','8','9','0','-','_','$']
 scraped = os.listdir('yahoo_links_1')
 urls = []
+prefixes = []
 for ch0 in char_list:
     for ch1 in char_list:
         if not f'yahoo_{ch0}{ch1}.txt' in scraped:
             urls.append(f'http://web.archive.org/cdx/search/?url=https://www.finance.yahoo.com/news/{ch0}{ch1}*')
+        # The CDX API mode tracks completion in its own checkpoint files
+        if not cdx_client.load_checkpoint(f'{ch0}{ch1}')['done']:
+            prefixes.append(f'{ch0}{ch1}')
 
 # print(urls)
 
@@ -58,25 +66,11 @@ def scrape_article_content(url,local_driver):
 
         df = pd.read_csv(input_filename, delimiter=' ', header=None, usecols=[1,2], names=['date_time','url'])
 
-        # print(df)
-        # Filter rows where the URL contains '.html'
-        df = df[df['url'].str.contains('.html')]
-
-        # Truncate the URLs at '.html'
-        df['url'] = df['url'].str.split('.html').str[0] + '.html'
-        df['url'] = df['url'].str.replace(':80', '', regex=False)
-        df['url'] = df['url'].str.replace('http:', 'https:', regex=False)
-
         # #Remove the specified pattern "%20 ... 2525252F"
         # pattern_to_remove = r'%20.*2F(?=.*2F)'
         # df['url'] = df['url'].apply(lambda x: re.sub(pattern_to_remove, '', x, flags=re.DOTALL | re.IGNORECASE))
 
-        # Remove URLs containing "news/%"
-        df = df[~df['url'].str.contains('news/%')]
-        df = df[~df['url'].str.contains("news/'")]
-
-        # Remove duplicates
-        df.drop_duplicates(subset=['url'],inplace=True)
+        df = cdx_client.clean_links(df)
         # print(df)
         # Write the unique URLs to a CSV file
         df.to_csv(output_filename, index=False)
@@ -132,8 +126,32 @@ if __name__ == "__main__":
     
     # Set number of processes (adjust based on your system's capabilities)
     num_process = 10
-    
-    if urls:
+
+    # Query the CDX API directly (JSON, paginated, resumable) instead of rendering it in Firefox
+    use_cdx_api = True
+    # Start from news/* and split only prefixes the CDX server truncates, instead of
+    # the fixed two character prefixes; progress is kept in yahoo_links_1/frontier.json
+    use_adaptive_prefixes = True
+    # Once the full crawl has finished, later runs only ask for captures newer than each
+    # prefix's watermark; new URLs go to yahoo_links_1/deltas/ and yahoo_links_new.csv
+    use_incremental_refresh = True
+
+    if use_cdx_api and use_adaptive_prefixes:
+        if use_incremental_refresh and cdx_client.frontier_finished():
+            cdx_client.refresh_links(num_cdx_threads)
+        else:
+            cdx_client.crawl_frontier(num_cdx_threads)
+    elif use_cdx_api:
+        if prefixes:
+            print(f"Fetching {len(prefixes)} prefixes from the CDX API with {num_cdx_threads} threads")
+            with ThreadPoolExecutor(max_workers=num_cdx_threads) as executor:
+                futures = {executor.submit(cdx_client.fetch_prefix_links, prefix): prefix for prefix in prefixes}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"Error fetching prefix {futures[future]}: {e}")
+    elif urls:
         # Choose processing method
         use_multiprocessing = True  # Set to False to use single-process
         
@@ -156,27 +174,6 @@ if __name__ == "__main__":
             finally:
                 driver.quit()
     
-    # Rest of your code for processing CSV files...
-    folder_path = 'yahoo_links_1'
-    csv_files = glob.glob(os.path.join(folder_path, '*.csv'))
-    dfs = []
-    
-    for csv_file in csv_files:
-        try:
-            df = pd.read_csv(csv_file)
-            dfs.append(df)
-        except Exception as e:
-            print(f"Error reading {csv_file}: {e}")
-    
-    # Only concatenate if we have dataframes
-    if dfs:
-        merged_df = pd.concat(dfs, ignore_index=True)
-        merged_df.drop_duplicates(subset=['url'], inplace=True)
-        print(f"Found {len(merged_df)} unique URLs")
-        
-        # Save the merged DataFrame
-        output_file = 'yfin_urls.csv'
-        merged_df.to_csv(output_file, index=False)
-        print(f"Results saved to {output_file}")
-    else:
-        print("No CSV files were processed. Check if the scraping was successful.")
\ No newline at end of file
+    # Merge the parts into yfin_urls.csv with an external sort, so memory stays
+    # bounded however many parts there are; parts already sorted are reused
+    link_parts.merge_link_parts('yahoo_links_1', 'yfin_urls.csv')